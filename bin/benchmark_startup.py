@@ -0,0 +1,60 @@
+import sys
+import time
+import yaml
+import argparse
+import numpy as np
+import multiprocessing as mp
+
+sys.path.append('../')
+from source.FlowStacks import stack_shape
+
+def measure(config, training, results):
+    """
+    method to time, in a fresh process, the imports, the model construction and
+    the first inference (tracing included) of a camera worker's model
+    """
+    start = time.time()
+    if training:
+        from source.Training import TrainingModel as Model
+    else:
+        from source.Model import Model
+    imported = time.time()
+    model = Model(config)
+    built = time.time()
+    model.infer(np.zeros(stack_shape(config), dtype=np.float32))
+    ready = time.time()
+    results.put((imported - start, built - imported, ready - built))
+
+if __name__ == "__main__":
+    """
+    compare model startup before (Caffe weight conversion, optimizers and compile)
+    and after (cached trunk weights, inference-only loading)
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with open('../config.yaml', "r") as f:
+        config = yaml.safe_load(f)
+
+    legacy_config = dict(config, trunk_weights_path=None)
+    variants = [("caffe weights + compile", legacy_config, True),
+        ("cached weights, inference only", config, False)]
+
+    # a fresh interpreter per run, as when a camera worker is restarted
+    ctx = mp.get_context("spawn")
+    for name, variant_config, training in variants:
+        timings = []
+        for _ in range(args.repeats):
+            results = ctx.Queue()
+            process = ctx.Process(target=measure, args=(variant_config, training, results))
+            process.start()
+            timings.append(results.get())
+            process.join()
+
+        imports, build, first_inference = np.mean(timings, axis=0)
+        print('{} ==================='.format(name.upper()))
+        print('Imports: {:.2f}s'.format(imports))
+        print('Model construction: {:.2f}s'.format(build))
+        print('First inference: {:.2f}s'.format(first_inference))
+        print('Total: {:.2f}s'.format(imports + build + first_inference))
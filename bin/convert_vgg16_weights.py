@@ -0,0 +1,16 @@
+import sys
+import yaml
+
+sys.path.append('../')
+from source.Model import save_vgg16_trunk_weights
+
+if __name__ == "__main__":
+    """
+    convert the Caffe VGG16 weights once into native Keras layout, so model
+    startup skips the per-layer transposition
+    """
+    with open('../config.yaml', "r") as f:
+        config = yaml.safe_load(f)
+
+    save_vgg16_trunk_weights(config)
+    print("VGG16 trunk weights written to {}".format(config["trunk_weights_path"]))
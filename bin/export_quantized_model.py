@@ -0,0 +1,37 @@
+import sys
+import yaml
+import argparse
+
+sys.path.append('../')
+from source.Model import Model
+from source.Quantization import QuantizedModel, load_flow_stacks, export_tflite, parity_report
+
+if __name__ == "__main__":
+    """
+    export a post-training quantized TFLite version of the fall detection model
+    and compare it against the float model
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["int8", "float16"], default="int8")
+    parser.add_argument("--flow_folder", required=True, help="optical flow dataset used for calibration and parity")
+    parser.add_argument("--nb_stacks", type=int, default=400)
+    args = parser.parse_args()
+
+    with open('../config.yaml', "r") as f:
+        config = yaml.safe_load(f)
+
+    # half of the sampled stacks calibrate the quantization, the other half check parity
+    stacks = load_flow_stacks(args.flow_folder, config["mean_file"],
+        config["sliding_window_length"], args.nb_stacks)
+    if len(stacks) < 2:
+        raise ValueError("Calibration and parity need at least 2 stacks, {} has {}.".format(
+            args.flow_folder, len(stacks)))
+    calibration_stacks = stacks[:len(stacks)//2]
+    parity_stacks = stacks[len(stacks)//2:]
+
+    model = Model(config)
+    export_tflite(model, config["quantized_model_path"], args.mode, calibration_stacks)
+    print("Quantized model written to {}".format(config["quantized_model_path"]))
+
+    quantized_model = QuantizedModel(config)
+    parity_report(model, quantized_model, parity_stacks, config["quantized_model_path"] + ".parity.json")
@@ -1,49 +1,18 @@
 import sys
-import multiprocessing
+import yaml
 
 sys.path.append('../')
-from source.Camera import Camera
-from source.Monitor import Monitor
+from source.Supervisor import CameraSupervisor
 
-def single_camera_detection(idx):
-    queue = multiprocessing.Queue()
-
-    # initialize camera
-    camera_0 = Camera(idx, queue)
-    
-    # initalize monitoring system
-    monitor = Monitor(queue)
-
-    camera_0.start()
-    monitor.start()
-    camera_0.join()
-    monitor.join()
-
-def multi_camera_detection(idxs):
-    queue = multiprocessing.Queue()
-
-    # initialize camera
-    camera_0 = Camera(idxs[0], queue)
-    camera_1 = Camera(idxs[1], queue)
-    
-    # initalize monitoring system
-    monitor = Monitor(queue)
-
-    camera_0.start()
-    camera_1.start()
-    monitor.start()
-    camera_0.join()
-    camera_1.join()
-    monitor.join()
+def load_config():
+    with open('../config.yaml', "r") as f:
+        return yaml.safe_load(f)
 
 if __name__ == "__main__":
     """
-    execute fall detection monitoring software
+    execute fall detection monitoring software on every camera source
+    listed under camera_sources in config.yaml
     """
-    # launch single camera fall detection system
-    single_camera_detection(0)
-
-    # launch double camera fall detection system
-    #idxs = [0, 1]
-    #multi_camera_detection(idxs)
-
+    config = load_config()
+    supervisor = CameraSupervisor(config)
+    supervisor.run()
@@ -1,142 +1,100 @@
 import os
 import cv2
+import sys
+import glob
+import time
+import argparse
 import numpy as np
+from multiprocessing import Pool
 
-def rotate_image_left(img):
-    height, width = img.shape[:2]
-    # first param: rotate from center, second param: angle, third param: scale
-    rotation_matrix = cv2.getRotationMatrix2D((width/2, height/2), 20, 1)
-    rotated_img = cv2.warpAffine(img, rotation_matrix, (width, height))
-    return rotated_img
+sys.path.append('../')
+from source.Augmentation import AugmentationEngine
+from source.FlowStore import ArrayStore
 
-def rotate_image_right(img):
-    height, width = img.shape[:2]
-    # first param: rotate from center, second param: angle, third param: scale
-    rotation_matrix = cv2.getRotationMatrix2D((width/2, height/2), 340, 1)
-    rotated_img = cv2.warpAffine(img, rotation_matrix, (width, height))
-    return rotated_img
+# the augmented copies of every frame, in the order they are written (0..3),
+# each one a chain of source.Augmentation ops applied in order: right rotation
+# + double box blur, horizontal flip + darkening, left rotation + contrast
+# and desaturation
+AUGMENTATIONS = [
+    [{"op": "rotate", "angle": 340}, {"op": "box_blur", "size": 3, "passes": 2}],
+    [{"op": "flip"}, {"op": "brightness", "delta": -70}],
+    [{"op": "rotate", "angle": 20}, {"op": "contrast", "contrast": 70, "brightness": 10}],
+    [{"op": "saturation", "delta": -40}],
+]
 
-def zoom_image(img, zoom_factor):
-    height, width = img.shape[:2]
-    # define new boundaries
-    x1 = int(0.5 * width * (1 - 1/zoom_factor))
-    x2 = int(width - 0.5 * width * (1 - 1/zoom_factor))
-    y1 = int(0.5 * height *(1 - 1/zoom_factor))
-    y2 = int(height - 0.5 * height * (1 - 1/zoom_factor))
-    
-    img_cropped = img[y1:y2,x1:x2]
-    return cv2.resize(img_cropped, None, fx=zoom_factor, fy=zoom_factor)
+data_folder = 'C:/Users/denisebeh/Downloads/URFD/'
+output_path = 'C:/Users/denisebeh/Downloads/datasets/augmented/'
 
-def increase_brightness(img):
-    bright = np.ones(img.shape, dtype="uint8") * 150
-    bright_increase_img = cv2.add(img, bright)
-    return bright_increase_img
+def list_videos(data_folder):
+    """
+    method to list (name, label, sorted frame paths) for every video of the
+    'fall' (label 0) and 'adl' (label 1) folders of data_folder
+    """
+    videos = []
+    for kind, label in [('fall', 0), ('adl', 1)]:
+        path = os.path.join(data_folder, kind)
+        events = sorted(f for f in os.listdir(path) if os.path.isdir(os.path.join(path, f)))
+        for event in events:
+            images = sorted(glob.glob(os.path.join(path, event, '*.png')))
+            if images:
+                videos.append(('{}/{}'.format(kind, event), label, images))
+    return videos
 
-def decrease_brightness(img):
-    bright = np.ones(img.shape, dtype="uint8") * 70
-    bright_decrease_img = cv2.subtract(img, bright)
-    return bright_decrease_img
+def init_worker(root):
+    global store, engine
+    # one core per worker, the parallelism comes from the pool
+    cv2.setNumThreads(1)
+    store = ArrayStore(root)
+    engine = AugmentationEngine(AUGMENTATIONS)
 
-def flip_image_hori(img):
-    flipped_img = cv2.flip(img, 3)
-    return flipped_img
+def augment_video(job):
+    """
+    method to augment the frames of a video batch by batch with every chain, straight
+    into one memmap per chain, returns (name, label, number of frames)
+    """
+    (name, label, images), batch_size = job
+    outputs = [None] * len(engine)
+    for start in range(0, len(images), batch_size):
+        frames = np.stack([cv2.imread(image) for image in images[start:start+batch_size]])
+        for k, augmented in enumerate(engine.augment_all(frames)):
+            if outputs[k] is None:
+                outputs[k] = store.create('{}/aug{}'.format(name, k), len(images), *augmented.shape[1:])
+            outputs[k][start:start+len(augmented)] = augmented
+    for output in outputs:
+        output.flush()
+    return name, label, len(images)
 
-def sharpen_image(img):
-    kernel = np.array([ [0, -1, 0],
-                        [-1, 5, -1],
-                        [0, -1, 0]  ])
-    sharpened_img = cv2.filter2D(img, -1, kernel)
-    return sharpened_img
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_folder", default=data_folder)
+    parser.add_argument("--output_path", default=output_path)
+    parser.add_argument("--batch_size", type=int, default=32, help="frames augmented at once")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    return parser.parse_args()
 
-def box_blur_image(img):
-    blurred_img = cv2.blur(img, (3, 3))
-    blurred_img = cv2.blur(blurred_img, (3, 3))
-    return blurred_img
+if __name__ == "__main__":
+    """
+    augment every URFD video with each chain of AUGMENTATIONS into an ArrayStore
+    (one array per video and chain, named <video>/aug<k>), skipping the videos
+    already in it
+    """
+    args = parse_args()
+    store = ArrayStore(args.output_path)
+    videos = [video for video in list_videos(args.data_folder)
+        if not all('{}/aug{}'.format(video[0], k) in store for k in range(len(AUGMENTATIONS)))]
+    print("{} videos to augment, {} workers".format(len(videos), args.workers))
 
-def positive_contrast_image(img):
-    brightness = 10
-    contrast = 70
-    dummy = np.int16(img)
-    dummy = dummy * (contrast/127+1) - contrast + brightness
-    dummy = np.clip(dummy, 0, 255)
-    img = np.uint8(dummy)
-    return img
+    start = time.time()
+    nb_total_frames = 0
+    with Pool(args.workers, initializer=init_worker, initargs=(args.output_path,)) as pool:
+        jobs = [(video, args.batch_size) for video in videos]
+        for done, (name, label, nb_frames) in enumerate(pool.imap(augment_video, jobs), start=1):
+            for k in range(len(AUGMENTATIONS)):
+                store.add('{}/aug{}'.format(name, k), label, nb_frames)
+            store.save_index()
+            nb_total_frames += nb_frames
+            print("[{}/{}] {}: {} frames".format(done, len(videos), name, nb_frames))
 
-def negative_saturation_image(img):
-    value = -40
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    h, s, v = cv2.split(hsv)
-    if value >= 0:
-        lim = 255 - value
-        s[s > lim] = 255
-        s[s <= lim] += value
-    else:
-        lim = np.absolute(value)
-        s[s < lim] = 0
-        s[s >= lim] -= np.absolute(value)
-
-    final_hsv = cv2.merge((h, s, v))
-    img = cv2.cvtColor(final_hsv, cv2.COLOR_HSV2BGR)
-    return img
-
-falls_directory = "C:/Users/denisebeh/Downloads/datasets/Falls"
-adls_directory = "C:/Users/denisebeh/Downloads/datasets/ADLs"
-mode = 0o666
-
-# process falls
-for num in range(1,31):
-    num = str(num).zfill(2)
-    directory1 = 'fall-' + num + '-cam0-rgb'
-    path1 = os.path.join(falls_directory, directory1)
-    os.mkdir(path1, mode)
-    x = len(os.listdir('C:/Users/denisebeh/Downloads/URFD/fall/fall-' + num + '-cam0-rgb')) + 1
-    for j in range(1, x):
-        data = 'fall-' + num +'-cam0-rgb-' + str(j).zfill(3)
-        directory = "fall[" + data + "]"    # sub folder for each image
-        parent_dir = path1
-        path = os.path.join(parent_dir, directory)
-        os.mkdir(path, mode)
-
-        # get augmented images
-        input = cv2.imread('C:/Users/denisebeh/Downloads/URFD/fall/fall-' + num + '-cam0-rgb/' + data + '.png')
-        image_0 = rotate_image_right(input)
-        image_0 = box_blur_image(image_0)
-        image_1 = flip_image_hori(input)
-        image_1 = decrease_brightness(image_1)
-        image_2 = rotate_image_left(input)
-        image_2 = positive_contrast_image(image_2)
-        image_3 = negative_saturation_image(input)
-        os.path.join(path, "")
-        cv2.imwrite(path + "/fall0.png", image_0)
-        cv2.imwrite(path + "/fall1.png", image_1)
-        cv2.imwrite(path + "/fall2.png", image_2)
-        cv2.imwrite(path + "/fall3.png", image_3)
-
-# process ADL
-for num in range(1, 41):
-    num = str(num).zfill(2)
-    directory2 = 'adl-' + num + '-cam0-rgb'
-    path2 = os.path.join(adls_directory, directory2)
-    os.mkdir(path2, mode)
-    x = len(os.listdir('C:/Users/denisebeh/Downloads/URFD/adl/adl-' + num + '-cam0-rgb')) + 1
-    for j in range(1, x):
-        data = 'adl-' + num +'-cam0-rgb-' + str(j).zfill(3)
-        directory = "adl[" + data + "]"     # sub folder for each image
-        parent_dir = path2
-        path = os.path.join(parent_dir, directory)
-        os.mkdir(path, mode)
-        
-        # get augmented images
-        input = cv2.imread('C:/Users/denisebeh/Downloads/URFD/adl/adl-' + num + '-cam0-rgb/' + data + '.png')
-        image_0 = rotate_image_right(input)
-        image_0 = box_blur_image(image_0)
-        image_1 = flip_image_hori(input)
-        image_1 = decrease_brightness(image_1)
-        image_2 = rotate_image_left(input)
-        image_2 = positive_contrast_image(image_2)
-        image_3 = negative_saturation_image(input)
-        os.path.join(path, "")
-        cv2.imwrite(path + "/adl0.png", image_0)
-        cv2.imwrite(path + "/adl1.png", image_1)
-        cv2.imwrite(path + "/adl2.png", image_2)
-        cv2.imwrite(path + "/adl3.png", image_3)
\ No newline at end of file
+    elapsed = time.time() - start
+    print("{} frames augmented in {:.1f}s, {:.1f} frames/s".format(nb_total_frames, elapsed,
+        nb_total_frames / max(elapsed, 1e-6)))
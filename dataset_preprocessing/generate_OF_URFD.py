@@ -1,57 +1,155 @@
 import os
 import cv2
-import glob
 import sys
-sys.path.append('/usr/local/lib/python2.7/site-packages/')
-#os.system('/home/adrian/dense_flow/build/extract_cpu -f={} -x={} -y={} -i=tmp/image -b 20 -t 1 -d 3 -o=dir'.format('test.avi', '/flow_x', '/flow_y'))
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from multiprocessing import Pool
+
+sys.path.append('../')
 
 data_folder = '/Users/denisebeh/NUSy3s2/cs3244/preprocessed_dataset/with_augmented/'
 output_path = '/Users/denisebeh/NUSy3s2/cs3244/preprocessed_dataset/optical_flow/'
+extract_cpu = '/Users/denisebeh/NUSy3s2/cs3244/dense_flow/build/extract_cpu'
 images = ["frame_1", "frame_2", "frame_3", "frame_4", "frame_5"]
-i = 0
-
-#activity_folders.sort()
-#for actor_folder in actor_folders:
-#    print(i, actor_folder)
-#    i += 1
-if not os.path.exists(output_path):
-    os.mkdir(output_path)
-    #video_folders = [f for f in os.listdir(data_folder + activity_folder + '/Videos') if os.path.isfile(os.path.join(data_folder + activity_folder + '/Videos/', f))]
-    #print(data_folder + activity_folder + '/Videos')
-    #video_folders.sort()
-    #print(len(video_folders))
-#    action_folders = [f for f in os.listdir(data_folder + actor_folder) if os.path.isdir(os.path.join(data_folder + actor_folder, f))]x``
-#    action_folders.sort()
-
-
-folders = [f for f in os.listdir(data_folder) if os.path.isdir(os.path.join(data_folder, f))]
-folders.sort()
-for folder in folders:
-    #if actor_folder != 'Ahmad': continue
-    event_folders = [f for f in os.listdir(data_folder + folder) if os.path.isdir(os.path.join(data_folder + folder + '/', f))]
-    event_folders.sort()
-    for event_folder in event_folders:
-        path = data_folder + folder + '/' + event_folder
-
-        # vid_file = data_folder + activity_folder  + '/Videos/' + video_folder.replace(' ','')
-        flow = output_path + folder + '/' + event_folder
-        if not os.path.exists(flow):
-            os.makedirs(flow)
-            print(flow, path)
-
-        for image in images:
-            video_path = os.path.join(path, (image + ".mp4"))
-            image_dir = os.path.join(flow, image)
-            if not os.path.exists(image_dir):
-                os.makedirs(image_dir)
-            
-            #print(vid_file, flow)
-            #if not os.path.exists(flow):
-            #    os.makedirs(flow)
-            #else:
-            #    files = [f for f in os.listdir(flow) if os.path.isfile(os.path.join(flow + '/', f))]       
-            #    if len(files) > 0:
-            #        continue
-            #os.system('/home/adrian/dense_flow/build/extract_cpu -f={} -x={} -y={} -i=tmp/image -b=20 -t=1 -d=0 -s=1 -o=dir'.format(video_folder, flow + '/flow_x', flow + '/flow_y'))
-            #os.system('/home/anunez/dense_flow2/build/extract_cpu -f={} -x={} -y={} -i=tmp/image -b=20 -t=1 -d=0 -s=1 -o=dir'.format(path, flow + '/flow_x', flow + '/flow_y'))
-            os.system('/Users/denisebeh/NUSy3s2/cs3244/dense_flow/build/extract_cpu -f={} -x={} -y={} -i=tmp/image -b=20 -t=1 -d=0 -s=1 -o=dir'.format(video_path, image_dir + '/flow_x', image_dir + '/flow_y'))
+
+# written once all the flow images of a video are on disk
+COMPLETE_MARKER = '.complete'
+
+def list_jobs(data_folder, output_path):
+    """
+    method to list (video_path, image_dir) for every augmented frame_N.mp4
+    of every event folder, image_dir being where its flow images go
+    """
+    jobs = []
+    folders = [f for f in os.listdir(data_folder) if os.path.isdir(os.path.join(data_folder, f))]
+    folders.sort()
+    for folder in folders:
+        event_folders = [f for f in os.listdir(os.path.join(data_folder, folder))
+            if os.path.isdir(os.path.join(data_folder, folder, f))]
+        event_folders.sort()
+        for event_folder in event_folders:
+            path = os.path.join(data_folder, folder, event_folder)
+            flow = os.path.join(output_path, folder, event_folder)
+            for image in images:
+                video_path = os.path.join(path, image + ".mp4")
+                if os.path.exists(video_path):
+                    jobs.append((video_path, os.path.join(flow, image)))
+    return jobs
+
+def count_frames(video_path):
+    capture = cv2.VideoCapture(video_path)
+    nb_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return nb_frames
+
+def is_complete(video_path, image_dir):
+    """
+    a video is done when its marker exists, or, for outputs of earlier runs,
+    when there is one flow_x and one flow_y image per pair of consecutive frames
+    """
+    if os.path.exists(os.path.join(image_dir, COMPLETE_MARKER)):
+        return True
+    nb_x = len(glob.glob(os.path.join(image_dir, 'flow_x_*.jpg')))
+    nb_y = len(glob.glob(os.path.join(image_dir, 'flow_y_*.jpg')))
+    return nb_x > 0 and nb_x == nb_y and nb_x >= count_frames(video_path) - 1
+
+def run_extract_cpu(video_path, image_dir, bound):
+    """
+    method to run dense_flow's extract_cpu on a video, returns the number of flow pairs written
+    """
+    # the rgb frames extract_cpu also writes go to a private folder, workers must not share one
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        subprocess.run([extract_cpu, '-f={}'.format(video_path), '-x={}'.format(os.path.join(image_dir, 'flow_x')),
+            '-y={}'.format(os.path.join(image_dir, 'flow_y')), '-i={}'.format(os.path.join(tmp_dir, 'image')),
+            '-b={}'.format(bound), '-t=1', '-d=0', '-s=1', '-o=dir'], check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return len(glob.glob(os.path.join(image_dir, 'flow_x_*.jpg')))
+
+def run_flow_engine(video_path, image_dir, engine):
+    """
+    method to compute the flow of a video in process, written with the same
+    naming (flow_x_00001.jpg, ...) and quantization as extract_cpu
+    """
+    capture = cv2.VideoCapture(video_path)
+    ret, prev_frame = capture.read()
+    nb_pairs = 0
+    while ret:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        img_x, img_y = engine.compute(prev_frame, frame)
+        nb_pairs += 1
+        cv2.imwrite(os.path.join(image_dir, 'flow_x_{:05d}.jpg'.format(nb_pairs)), img_x)
+        cv2.imwrite(os.path.join(image_dir, 'flow_y_{:05d}.jpg'.format(nb_pairs)), img_y)
+        prev_frame = frame
+    capture.release()
+    return nb_pairs
+
+def init_worker(method, bound):
+    global engine, flow_bound
+    # one core per worker, the parallelism comes from the pool
+    cv2.setNumThreads(1)
+    flow_bound = bound
+    engine = None
+    if method != 'extract_cpu':
+        from source.OpticalFlow import create_flow_engine
+        engine = create_flow_engine({"flow_engine": method, "flow_bound": bound})
+
+def process_video(job):
+    """
+    method to generate the flow images of one video unless they are complete already,
+    returns (video_path, number of flow pairs, seconds spent, skipped)
+    """
+    video_path, image_dir = job
+    if is_complete(video_path, image_dir):
+        return video_path, 0, 0.0, True
+
+    os.makedirs(image_dir, exist_ok=True)
+    start = time.time()
+    if engine is None:
+        nb_pairs = run_extract_cpu(video_path, image_dir, flow_bound)
+    else:
+        nb_pairs = run_flow_engine(video_path, image_dir, engine)
+    open(os.path.join(image_dir, COMPLETE_MARKER), 'w').close()
+    return video_path, nb_pairs, time.time() - start, False
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_folder", default=data_folder)
+    parser.add_argument("--output_path", default=output_path)
+    parser.add_argument("--method", default="extract_cpu", choices=["extract_cpu", "tvl1", "farneback", "dis"],
+        help="external dense_flow binary or an in-process flow engine")
+    parser.add_argument("--bound", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    """
+    generate the optical flow images of every augmented URFD video with a process
+    pool, skipping videos whose flow is already complete
+    """
+    args = parse_args()
+    jobs = list_jobs(args.data_folder, args.output_path)
+    print("{} videos to check, {} workers".format(len(jobs), args.workers))
+
+    start = time.time()
+    nb_total_pairs, nb_skipped = 0, 0
+    with Pool(args.workers, initializer=init_worker, initargs=(args.method, args.bound)) as pool:
+        for done, (video_path, nb_pairs, seconds, skipped) in enumerate(pool.imap_unordered(process_video, jobs), start=1):
+            if skipped:
+                nb_skipped += 1
+                continue
+            nb_total_pairs += nb_pairs
+            print("[{}/{}] {}: {} frames, {:.1f} frames/s".format(done, len(jobs), video_path,
+                nb_pairs, nb_pairs / max(seconds, 1e-6)))
+
+    elapsed = time.time() - start
+    print("{} frames in {:.1f}s, {:.1f} frames/s overall, {} complete videos skipped".format(
+        nb_total_pairs, elapsed, nb_total_pairs / max(elapsed, 1e-6), nb_skipped))
@@ -0,0 +1,239 @@
+"""
+Single pass version of the URFD preprocessing chain (augment_data.py ->
+preprocessing_with_augmented.py -> video_writer.py -> generate_OF_URFD.py ->
+saveFeatures):
+
+1- The original RGB frames of every video are read once. Fall videos are split
+   into their pre-fall, fall and post-fall segments with the segment index of
+   preprocessing.py (built from the CSV labels if missing), ADL videos are a
+   single 'NotFalls' segment.
+
+2- Every segment goes through the original frames and each augmentation chain of
+   augment_data.AUGMENTATIONS (frame_1 to frame_5, as before). Frames are
+   augmented, resized to --size squares (W,H by default) and the optical flow between consecutive frames
+   is computed in memory by a pool of workers, nothing is re-encoded.
+
+3- The sliding window stacks of every segment go through the VGG16 trunk in
+   batches and only the features and labels are stored, in the same layout as
+   saveFeatures. The flow itself can be kept too, as a FlowStore, with --flow_store.
+
+Completed segments are recorded, an interrupted run resumes where it stopped.
+"""
+
+import os
+import cv2
+import sys
+import time
+import h5py
+import queue
+import yaml
+import argparse
+import numpy as np
+import scipy.io as sio
+from multiprocessing import Pool
+
+from augment_data import AUGMENTATIONS
+
+sys.path.append('../')
+from source.Augmentation import AugmentationEngine
+from source.FlowStore import FlowStore
+from source.FlowStacks import stack_batches, stack_shape
+from source.Resizer import FrameResizer, INTERPOLATIONS
+from source.Segments import load_segment_index
+
+data_folder = '/Users/denisebeh/NUSy3s2/cs3244/URFD_images_not_segmented/original_images/'
+falls_labels = '/Users/denisebeh/NUSy3s2/cs3244/URFD_images_not_segmented/urfall-cam0-falls.csv'
+adls_labels = '/Users/denisebeh/NUSy3s2/cs3244/URFD_images_not_segmented/urfall-cam0-adls.csv'
+segment_index = '../develop/saved_features/segments_urfd.npy'
+features_file = '../develop/saved_features/features_urfd_tf.h5'
+labels_file = '../develop/saved_features/labels_urfd_tf.h5'
+mean_file = '../develop/flow_mean.mat'
+features_key = 'features'
+labels_key = 'labels'
+W, H = 224, 224 # default shape of the frames the flow is computed on, see --size
+L = 10
+AUGMENT_BATCH = 32
+
+def list_segments(data_folder, index):
+    """
+    method to list the segments of the index as (name, class, frame paths), class
+    being 0 for falls and 1 for the rest, named as the folders of the old pipeline.
+    The frames are sliced from the original videos, those missing on disk are left out
+    """
+    segments = []
+    for i, (name, label) in enumerate(zip(index.names, index.labels)):
+        if os.path.isdir(index.video_folder(data_folder, index.segments[i]["video"])):
+            segments.append((name, int(label), index.frames(i, data_folder)))
+    return segments
+
+def list_jobs(segments):
+    """
+    method to expand the segments into one job per variant, frame_1 being the
+    original frames and frame_k+2 the kth augmentation chain. Segments with
+    fewer than L flow images do not give a single stack and are left out
+    """
+    jobs = []
+    for name, label, images in segments:
+        if len(images) - 1 < L:
+            continue
+        for variant in range(len(AUGMENTATIONS) + 1):
+            jobs.append((name + '/frame_{}'.format(variant + 1), label, images, variant))
+    return jobs
+
+def init_worker(method, bound, size, interpolation):
+    global engine, augmenter, resize
+    # one core per worker, the parallelism comes from the pool
+    cv2.setNumThreads(1)
+    from source.OpticalFlow import create_flow_engine
+    engine = create_flow_engine({"flow_engine": method, "flow_bound": bound})
+    augmenter = AugmentationEngine(AUGMENTATIONS)
+    resize = FrameResizer(size, size, interpolation)
+
+def compute_flow(job):
+    """
+    method to stream the frames of a job through augmentation, resize and optical
+    flow, returns the job and its quantized flow as a (frames-1, size, size, 2) uint8 array
+    """
+    index, (name, label, images, variant) = job
+    flow = np.empty((len(images) - 1, resize.h, resize.w, 2), dtype=np.uint8)
+    prev_frame = None
+    # frames are read and augmented AUGMENT_BATCH at a time
+    for start in range(0, len(images), AUGMENT_BATCH):
+        frames = np.stack([cv2.imread(image) for image in images[start:start+AUGMENT_BATCH]])
+        if variant > 0:
+            frames = augmenter.augment(frames, variant - 1)
+        for i, frame in enumerate(frames, start=start):
+            frame = resize(frame)
+            if prev_frame is not None:
+                flow[i-1, ..., 0], flow[i-1, ..., 1] = engine.compute(prev_frame, frame)
+            prev_frame = frame
+    return index, flow
+
+def extract_features(feature_extractor, flow, flow_mean, batch_size):
+    """
+    method to run every sliding window stack of a video's flow through the
+    feature extractor: stack j holds the flow images j to j+L-1, oldest first
+    """
+    features = np.empty((len(flow) - L + 1, feature_extractor.output_shape[-1]), dtype=np.float32)
+    for b, stacks in stack_batches(flow, L, flow_mean, batch_size):
+        features[b:b+len(stacks)] = feature_extractor.predict(stacks, batch_size=len(stacks))
+    return features
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_folder", default=data_folder)
+    parser.add_argument("--falls_labels", default=falls_labels)
+    parser.add_argument("--adls_labels", default=adls_labels)
+    parser.add_argument("--segment_index", default=segment_index, help="built from the label files if missing")
+    parser.add_argument("--features_file", default=features_file)
+    parser.add_argument("--labels_file", default=labels_file)
+    parser.add_argument("--mean_file", default=mean_file)
+    parser.add_argument("--flow_store", default=None, help="FlowStore folder to also keep the flow of every job in")
+    parser.add_argument("--method", default="tvl1", choices=["tvl1", "farneback", "dis"])
+    parser.add_argument("--bound", type=int, default=20)
+    parser.add_argument("--batch_size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--size", type=int, default=W, help="side of the square frames, the mean file must match it")
+    parser.add_argument("--interpolation", default="linear", choices=sorted(INTERPOLATIONS))
+    parser.add_argument("--max_in_flight", type=int, default=None,
+        help="flow arrays computed ahead of the feature extraction, 2 per worker by default")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    """
+    compute the URFD features in a single streaming pass, the flow of the next
+    jobs is computed by the pool while the trunk runs on the current one, with a
+    bounded number of flow arrays waiting
+    """
+    args = parse_args()
+    with open('../config.yaml', "r") as f:
+        config = yaml.safe_load(f)
+
+    jobs = list_jobs(list_segments(args.data_folder,
+        load_segment_index(args.segment_index, args.falls_labels, args.adls_labels, args.data_folder)))
+    job_stacks = np.array([len(images) - L for _, _, images, _ in jobs], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(job_stacks)))
+    nb_total_stacks = int(offsets[-1])
+
+    # the trunk and the flow mean are those of the chosen frame size
+    config["frame_size"] = args.size
+    flow_mean = sio.loadmat(args.mean_file)['image_mean'].astype(np.float32)
+    if flow_mean.shape != stack_shape(config):
+        raise ValueError('The flow mean of {} has shape {}, a size of {} needs one of shape {}.'.format(
+            args.mean_file, flow_mean.shape, args.size, stack_shape(config)))
+
+    # the workers are forked before the h5 files are opened and TensorFlow is loaded
+    pool = Pool(args.workers, initializer=init_worker,
+        initargs=(args.method, args.bound, args.size, args.interpolation))
+
+    # same datasets as saveFeatures, opened in 'a' mode so that a previous run is kept
+    h5features = h5py.File(args.features_file, 'a')
+    h5labels = h5py.File(args.labels_file, 'a')
+    # chunks can not be larger than the datasets, an empty set is stored as is
+    chunk_rows = min(args.batch_size, nb_total_stacks)
+    features_storage, labels_storage = {}, {}
+    if chunk_rows > 0:
+        features_storage = dict(chunks=(chunk_rows, config["num_features"]), compression='gzip')
+        labels_storage = dict(chunks=(chunk_rows, 1), compression='gzip')
+    dataset_features = h5features.require_dataset(features_key, shape=(nb_total_stacks, config["num_features"]),
+        dtype='float32', exact=True, **features_storage)
+    dataset_labels = h5labels.require_dataset(labels_key, shape=(nb_total_stacks, 1),
+        dtype='float32', exact=True, **labels_storage)
+    dataset_stacks = h5features.require_dataset(features_key + '_stacks', shape=job_stacks.shape,
+        dtype='int64', exact=True, data=job_stacks)
+    if not np.array_equal(dataset_stacks[...], job_stacks):
+        raise ValueError('{} was extracted from a different set of videos, remove it to start over.'.format(
+            args.features_file))
+    dataset_done = h5features.require_dataset(features_key + '_done', shape=job_stacks.shape,
+        dtype='bool', exact=True)
+    done = dataset_done[...]
+    flow_store = FlowStore(args.flow_store) if args.flow_store else None
+
+    pending = [(k, job) for k, job in enumerate(jobs) if not done[k]]
+    print("{} jobs, {} left, {} workers".format(len(jobs), len(pending), args.workers))
+
+    from source.Model import load_vgg16_trunk
+    feature_extractor = load_vgg16_trunk(config)
+
+    # at most max_in_flight flow arrays are computed ahead of the trunk
+    max_in_flight = args.max_in_flight or 2 * args.workers
+    results = queue.Queue()
+    remaining = iter(pending)
+    def submit():
+        job = next(remaining, None)
+        if job is None:
+            return 0
+        pool.apply_async(compute_flow, (job,), callback=results.put, error_callback=results.put)
+        return 1
+
+    start = time.time()
+    nb_done_stacks = 0
+    with pool:
+        in_flight = sum(submit() for _ in range(max_in_flight))
+        nb_done = 0
+        while in_flight:
+            result = results.get()
+            if isinstance(result, BaseException):
+                raise result
+            in_flight += submit() - 1
+            nb_done += 1
+            k, flow = result
+            name, label, _, _ = jobs[k]
+            dataset_features[offsets[k]:offsets[k+1], :] = extract_features(feature_extractor, flow,
+                flow_mean, args.batch_size)
+            dataset_labels[offsets[k]:offsets[k+1], :] = label
+            if flow_store is not None:
+                flow_store.put(name, label, flow)
+                flow_store.save_index()
+
+            # the job only counts as done once its rows are on disk
+            h5labels.flush()
+            h5features.flush()
+            dataset_done[k] = True
+            h5features.flush()
+            nb_done_stacks += int(job_stacks[k])
+            print("[{}/{}] {}: {} stacks, {:.1f} stacks/s overall".format(nb_done, len(pending), name,
+                job_stacks[k], nb_done_stacks / max(time.time() - start, 1e-6)))
+
+    h5features.close()
+    h5labels.close()
@@ -0,0 +1,79 @@
+import os
+import cv2
+import sys
+import glob
+import time
+import argparse
+from multiprocessing import Pool
+
+sys.path.append('../')
+from source.FlowStore import FlowStore
+from source.FlowStacks import flow_image_files, read_flow_images
+
+data_folder = '/Users/denisebeh/NUSy3s2/cs3244/preprocessed_dataset/optical_flow/'
+output_path = '/Users/denisebeh/NUSy3s2/cs3244/preprocessed_dataset/flow_store/'
+class0 = 'Falls'
+
+def list_videos(data_folder):
+    """
+    method to list (name, label, flow folder) for every folder holding flow_x*.jpg
+    images under data_folder, the name being the folder relative to data_folder and
+    the label 0 under the 'Falls' folder, 1 otherwise
+    """
+    folders = sorted(set(os.path.dirname(f) for f in
+        glob.glob(os.path.join(data_folder, '**', 'flow_x*.jpg'), recursive=True)))
+    videos = []
+    for folder in folders:
+        name = os.path.relpath(folder, data_folder).replace(os.sep, '/')
+        videos.append((name, 0 if name.split('/')[0] == class0 else 1, folder))
+    return videos
+
+def init_worker(root):
+    global store
+    cv2.setNumThreads(1)
+    store = FlowStore(root)
+
+def pack_video(video):
+    """
+    method to decode the flow images of a folder straight into the video's memmap,
+    returns (name, label, number of frames)
+    """
+    name, label, folder = video
+    x_images, _ = flow_image_files(folder)
+    nb_frames = len(x_images)
+    height, width = cv2.imread(x_images[0], cv2.IMREAD_GRAYSCALE).shape
+
+    flow = read_flow_images(folder, out=store.create(name, nb_frames, height, width))
+    flow.flush()
+    return name, label, nb_frames
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_folder", default=data_folder)
+    parser.add_argument("--output_path", default=output_path)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    """
+    pack the flow_x/flow_y images of the optical flow dataset into a FlowStore,
+    one memory-mapped array per video, skipping the videos already packed
+    """
+    args = parse_args()
+    store = FlowStore(args.output_path)
+    videos = [video for video in list_videos(args.data_folder) if video[0] not in store]
+    print("{} videos to pack, {} workers".format(len(videos), args.workers))
+
+    start = time.time()
+    nb_total_frames = 0
+    with Pool(args.workers, initializer=init_worker, initargs=(args.output_path,)) as pool:
+        for done, (name, label, nb_frames) in enumerate(pool.imap(pack_video, videos), start=1):
+            # in listing order, so the index order does not depend on the workers; it is
+            # rewritten after every video and an interrupted run keeps what is done
+            store.add(name, label, nb_frames)
+            store.save_index()
+            nb_total_frames += nb_frames
+            print("[{}/{}] {}: {} frames".format(done, len(videos), name, nb_frames))
+
+    elapsed = time.time() - start
+    print("{} frames packed in {:.1f}s into {}".format(nb_total_frames, elapsed, args.output_path))
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import argparse
+
+from generate_features_URFD import data_folder, falls_labels, adls_labels, segment_index, W, L
+
+sys.path.append('../')
+from source.FlowStore import ArrayStore
+from source.Resizer import ResizeService, INTERPOLATIONS
+from source.Segments import load_segment_index
+
+output_path = '../develop/saved_features/frames_urfd/'
+resize_cache = '../develop/saved_features/resized_urfd/'
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_folder", default=data_folder)
+    parser.add_argument("--falls_labels", default=falls_labels)
+    parser.add_argument("--adls_labels", default=adls_labels)
+    parser.add_argument("--segment_index", default=segment_index)
+    parser.add_argument("--output_path", default=output_path)
+    parser.add_argument("--resize_cache", default=resize_cache)
+    parser.add_argument("--size", type=int, default=W, help="side of the square frames, 224, 160 and 112 are cached by preprocessing.py")
+    parser.add_argument("--interpolation", default="linear", choices=sorted(INTERPOLATIONS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    """
+    pack the resized BGR frames of every URFD segment (pre-fall, fall, post-fall
+    and ADL, as in generate_features_URFD.py) into an ArrayStore, the input of the
+    on-the-fly augmentation of source.OnlineFeatures
+    """
+    args = parse_args()
+    store = ArrayStore(args.output_path)
+    index = load_segment_index(args.segment_index, args.falls_labels, args.adls_labels,
+        args.data_folder)
+
+    # the videos are resized once into the cache, shared with preprocessing.py
+    start = time.time()
+    resizer = ResizeService(args.resize_cache, args.workers)
+    resizer.resize(index.videos(args.data_folder), [(args.size, args.size)], args.interpolation)
+
+    nb_total_frames = 0
+    for name, (video, first, end, label) in zip(index.names, index.segments):
+        if name in store or not os.path.isdir(index.video_folder(args.data_folder, video)):
+            continue
+        frames = resizer.frames(index.video_name(video), args.size, args.size, args.interpolation)[first:end]
+        if len(frames) - 1 < L:
+            continue
+        store.put(name, label, frames)
+        store.save_index()
+        nb_total_frames += len(frames)
+        print("{}: {} frames".format(name, len(frames)))
+
+    elapsed = time.time() - start
+    print("{} frames packed in {:.1f}s into {}".format(nb_total_frames, elapsed, args.output_path))
@@ -8,9 +8,9 @@ from matplotlib import pyplot as plt
 import os
 import h5py
 import scipy.io as sio
-import cv2
 import glob
-import gc
+import time
+import sys
 import json
 
 from tensorflow.keras.models import load_model, Model, Sequential
@@ -19,9 +19,14 @@ from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.layers import BatchNormalization, ELU
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
 from tensorflow.keras import backend as K
-from sklearn.metrics import confusion_matrix, accuracy_score
 from sklearn.model_selection import KFold, StratifiedShuffleSplit
 
+sys.path.append('../')
+from source.Evaluation import binary_metrics, print_metrics, roc_curve, pr_curve, best_threshold
+from source.FoldRunner import run_folds, summarize_folds, update_results
+from source.FlowStore import FlowStore
+from source.FlowStacks import read_flow_images, stack_batches
+
 os.environ["CUDA_DEVICE_ORDER"]= "PCI_BUS_ID"
 os.environ["CUDA_VISIBLE_DEVICES"]= "0"
 
@@ -30,6 +35,11 @@ data_folder = 'C:/Users/sieni/optical_flow/'
 mean_file = 'C:/Users/sieni/cs3244-fall-detection-project/develop/flow_mean.mat'
 vgg_16_weights = 'C:/Users/sieni/cs3244-fall-detection-project/develop/weights.h5'
 save_features = False
+# Root of a packed FlowStore to read the flow from instead of the jpg
+# images under data_folder (None to use the images)
+flow_store_folder = None
+# Stacks sent through the feature extractor at once
+extraction_batch_size = 64
 save_plots = True
 
 # Set to 'True' if you want to restore a previous trained models
@@ -61,6 +71,10 @@ use_val_for_training = True
 val_size = 100
 # Threshold to classify between positive and negative
 threshold = 0.5
+# Folds trained at the same time, threads per fold and base seed
+cv_workers = 5
+cv_threads_per_fold = 6
+cv_seed = 7
 
 # Name of the experiment
 exp = 'urfd_lr{}_batchs{}_batchnorm{}_w0_{}_epochs{}_'.format(
@@ -119,14 +133,6 @@ def plot_training_info(case, metrics, save, history):
             plt.show()
         plt.close(fig)
  
-def generator(list1, lits2):
-    '''
-    Auxiliar generator: returns the ith element of both given list with
-	 each call to next() 
-    '''
-    for x,y in zip(list1,lits2):
-        yield x, y
-          
 def saveFeatures(feature_extractor,
 		 features_file,
 		 labels_file,
@@ -136,7 +142,10 @@ def saveFeatures(feature_extractor,
     Function to load the optical flow stacks, do a feed-forward through the
 	 feature extractor (VGG16) and
     store the output feature vectors in the file 'features_file' and the 
-	labels in 'labels_file'.
+	labels in 'labels_file'. Stacks go through the network in batches of
+	 extraction_batch_size and the features are stored as float32 in
+	 chunked, compressed datasets. The completion of every video folder is
+	 recorded, so an interrupted run resumes with the first unfinished one.
     Input:
     * feature_extractor: model VGG16 until the fc6 layer.
     * features_file: path to the hdf5 file where the extracted features are
@@ -154,136 +163,133 @@ def saveFeatures(feature_extractor,
 
     # Load the mean file to subtract to the images
     d = sio.loadmat(mean_file)
-    flow_mean = d['image_mean']
-
-    # Fill the folders and classes arrays with all the paths to the data
-    folders, classes = [], []
-    fall_videos = [f for f in os.listdir(class0_path)
+    flow_mean = d['image_mean'].astype(np.float32)
+
+    if flow_store_folder:
+        # Packed flow (see dataset_preprocessing/pack_flow_URFD.py): videos,
+        # labels and frame counts all come from the store's index
+        store = FlowStore(flow_store_folder)
+        keep = store.frames >= L
+        folders = [name for name, k in zip(store.names, keep) if k]
+        classes = list(store.labels[keep])
+        folder_stacks = store.frames[keep] - L + 1
+    else:
+        # Fill the folders and classes arrays with all the paths to the data
+        folders, classes = [], []
+        fall_videos = [f for f in os.listdir(class0_path)
 			if os.path.isdir(os.path.join(class0_path, f))]
-    fall_videos.sort()
-
-    for fall_video in fall_videos:        
-        # iteratively process each augmented frame
-        fall_video_path = os.path.join(class0_path, fall_video)
-        for frame in frames:
-            frame_path = os.path.join(fall_video_path, frame)
-            frame_path = os.path.join(frame_path, '')
-            x_images = glob.glob(frame_path + 'flow_x*.jpg')
-            if int(len(x_images)) >= 10:
-                folders.append(frame_path)
-                classes.append(0)
-
-    not_fall_videos = [f for f in os.listdir(class1_path) 
+        fall_videos.sort()
+
+        for fall_video in fall_videos:        
+            # iteratively process each augmented frame
+            fall_video_path = os.path.join(class0_path, fall_video)
+            for frame in frames:
+                frame_path = os.path.join(fall_video_path, frame)
+                frame_path = os.path.join(frame_path, '')
+                x_images = glob.glob(frame_path + 'flow_x*.jpg')
+                if int(len(x_images)) >= 10:
+                    folders.append(frame_path)
+                    classes.append(0)
+
+        not_fall_videos = [f for f in os.listdir(class1_path) 
 			if os.path.isdir(os.path.join(class1_path, f))]
-    not_fall_videos.sort()
-
-    for not_fall_video in not_fall_videos:
-        #iteratively process each augmented frame
-        not_fall_video_path = os.path.join(class1_path, not_fall_video)
-        for frame in frames:
-            frame_path = os.path.join(not_fall_video_path, frame)
-            frame_path = os.path.join(frame_path, '')
-            x_images = glob.glob(frame_path + 'flow_x*.jpg')
-            if int(len(x_images)) >= 10:
-                folders.append(frame_path)
-                classes.append(1)
-
-    # Total amount of stacks, with sliding window = num_images-L+1
-    nb_total_stacks = 0
-    for folder in folders:
-        x_images = glob.glob(folder + '/flow_x*.jpg')
-        nb_total_stacks += len(x_images)-L+1
+        not_fall_videos.sort()
+
+        for not_fall_video in not_fall_videos:
+            #iteratively process each augmented frame
+            not_fall_video_path = os.path.join(class1_path, not_fall_video)
+            for frame in frames:
+                frame_path = os.path.join(not_fall_video_path, frame)
+                frame_path = os.path.join(frame_path, '')
+                x_images = glob.glob(frame_path + 'flow_x*.jpg')
+                if int(len(x_images)) >= 10:
+                    folders.append(frame_path)
+                    classes.append(1)
+
+        # Amount of stacks per folder, with sliding window = num_images-L+1,
+        # and the first row of each folder in the datasets
+        folder_stacks = np.array([len(glob.glob(folder + '/flow_x*.jpg'))-L+1
+			for folder in folders], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(folder_stacks)))
+    nb_total_stacks = int(offsets[-1])
     
-    # File to store the extracted features and datasets to store them
-    # IMPORTANT NOTE: 'w' mode totally erases previous data
-    h5features = h5py.File(features_file,'w')
-    h5labels = h5py.File(labels_file,'w')
-    dataset_features = h5features.create_dataset(features_key,
+    # Files to store the extracted features and datasets to store them,
+    # opened in 'a' mode so that the progress of a previous run is kept
+    h5features = h5py.File(features_file,'a')
+    h5labels = h5py.File(labels_file,'a')
+    # chunks can not be larger than the datasets, an empty set is stored as is
+    chunk_rows = min(extraction_batch_size, nb_total_stacks)
+    features_storage, labels_storage = {}, {}
+    if chunk_rows > 0:
+        features_storage = dict(chunks=(chunk_rows, num_features), compression='gzip')
+        labels_storage = dict(chunks=(chunk_rows, 1), compression='gzip')
+    dataset_features = h5features.require_dataset(features_key,
 			 shape=(nb_total_stacks, num_features),
-			 dtype='float64')
-    dataset_labels = h5labels.create_dataset(labels_key,
+			 dtype='float32', exact=True, **features_storage)
+    dataset_labels = h5labels.require_dataset(labels_key,
 			 shape=(nb_total_stacks, 1),
-			 dtype='float64')  
-    cont = 0
+			 dtype='float32', exact=True, **labels_storage)
+
+    # Per folder completion, only valid for the same list of folders
+    dataset_stacks = h5features.require_dataset(features_key + '_stacks',
+			 shape=folder_stacks.shape, dtype='int64', exact=True,
+			 data=folder_stacks)
+    if not np.array_equal(dataset_stacks[...], folder_stacks):
+        raise ValueError('{} was extracted from a different set of videos, '
+			 'remove it to start over.'.format(features_file))
+    dataset_done = h5features.require_dataset(features_key + '_done',
+			 shape=folder_stacks.shape, dtype='bool', exact=True)
+    done = dataset_done[...]
     
-    for folder, label in zip(folders, classes):
-        print("Processing folder: " + folder)
-        x_images = glob.glob(folder + '/flow_x*.jpg')
-        x_images.sort()
-        y_images = glob.glob(folder + '/flow_y*.jpg')
-        y_images.sort()
-        nb_stacks = len(x_images)-L+1
-        # Here nb_stacks optical flow stacks will be stored
-        flow = np.zeros(shape=(224,224,2*L,nb_stacks), dtype=np.float64)
-        gen = generator(x_images,y_images)
-        for i in range(len(x_images)):
-            flow_x_file, flow_y_file = next(gen)
-            img_x = cv2.imread(flow_x_file, cv2.IMREAD_GRAYSCALE)
-            img_y = cv2.imread(flow_y_file, cv2.IMREAD_GRAYSCALE)
-            # Assign an image i to the jth stack in the kth position, but also
-	    # in the j+1th stack in the k+1th position and so on	
-	    # (for sliding window) 
-            for s in list(reversed(range(min(10,i+1)))):
-                if i-s < nb_stacks:
-                    flow[:,:,2*s,  i-s] = img_x
-                    flow[:,:,2*s+1,i-s] = img_y
-            del img_x,img_y
-            gc.collect()
-            
-        # Subtract mean
-        flow = flow - np.tile(flow_mean[...,np.newaxis],
-			      (1, 1, 1, flow.shape[3]))
-        flow = np.transpose(flow, (3, 0, 1, 2)) 
-        predictions = np.zeros((flow.shape[0], num_features), dtype=np.float64)
-        truth = np.zeros((flow.shape[0], 1), dtype=np.float64)
-        # Process each stack: do the feed-forward pass and store
-	# in the hdf5 file the output
-        for i in range(flow.shape[0]):
-            prediction = feature_extractor.predict(
-					np.expand_dims(flow[i, ...],0))
-            predictions[i, ...] = prediction
-            truth[i] = label
-        dataset_features[cont:cont+flow.shape[0],:] = predictions
-        dataset_labels[cont:cont+flow.shape[0],:] = truth
-        cont += flow.shape[0]
+    start = time.time()
+    for k, (folder, label) in enumerate(zip(folders, classes)):
+        if done[k]:
+            continue
+        print("Processing folder {}/{}: {}".format(k+1, len(folders), folder))
+        nb_stacks = int(folder_stacks[k])
+        if flow_store_folder:
+            # memory-mapped, the windows below read straight from it
+            images = store.flow(folder)
+        else:
+            # Every flow image is read once, as uint8
+            images = read_flow_images(folder)
+
+        # The sliding window stacks are views of the images, only one
+        # batch at a time is expanded to float32 and mean-subtracted
+        for b, flow in stack_batches(images, L, flow_mean,
+			 extraction_batch_size):
+            predictions = feature_extractor.predict(flow, batch_size=len(flow))
+            row = offsets[k] + b
+            dataset_features[row:row+len(flow), :] = predictions
+
+        dataset_labels[offsets[k]:offsets[k+1], :] = label
+
+        # The folder only counts as done once its rows are on disk
+        h5labels.flush()
+        h5features.flush()
+        dataset_done[k] = True
+        h5features.flush()
+        print("{} stacks extracted, {:.1f} stacks/s".format(nb_stacks,
+			 nb_stacks / max(time.time() - start, 1e-6)))
+        start = time.time()
+
     h5features.close()
     h5labels.close()
     
 def test_video(feature_extractor, video_path, ground_truth):
     # Load the mean file to subtract to the images
     d = sio.loadmat(mean_file)
-    flow_mean = d['image_mean']
+    flow_mean = d['image_mean'].astype(np.float32)
     
-    x_images = glob.glob(video_path + '/flow_x*.jpg')
-    x_images.sort()
-    y_images = glob.glob(video_path + '/flow_y*.jpg')
-    y_images.sort()
-    nb_stacks = len(x_images)-L+1
-    # Here nb_stacks optical flow stacks will be stored
-    flow = np.zeros(shape=(224,224,2*L,nb_stacks), dtype=np.float64)
-    gen = generator(x_images,y_images)
-    for i in range(len(x_images)):
-        flow_x_file, flow_y_file = next(gen)
-        img_x = cv2.imread(flow_x_file, cv2.IMREAD_GRAYSCALE)
-        img_y = cv2.imread(flow_y_file, cv2.IMREAD_GRAYSCALE)
-        # Assign an image i to the jth stack in the kth position, but also
-	# in the j+1th stack in the k+1th position and so on
-	# (for sliding window) 
-        for s in list(reversed(range(min(10,i+1)))):
-            if i-s < nb_stacks:
-                flow[:,:,2*s,  i-s] = img_x
-                flow[:,:,2*s+1,i-s] = img_y
-        del img_x,img_y
-        gc.collect()
-    flow = flow - np.tile(flow_mean[...,np.newaxis], (1, 1, 1, flow.shape[3]))
-    flow = np.transpose(flow, (3, 0, 1, 2)) 
-    predictions = np.zeros((flow.shape[0], num_features), dtype=np.float64)
-    truth = np.zeros((flow.shape[0], 1), dtype=np.float64)
-    # Process each stack: do the feed-forward pass
-    for i in range(flow.shape[0]):
-        prediction = feature_extractor.predict(np.expand_dims(flow[i, ...],0))
-        predictions[i, ...] = prediction
-        truth[i] = ground_truth
+    # Every flow image is read once, the stacks are sliding window
+    # views of them and go through the network in batches
+    images = read_flow_images(video_path)
+    nb_stacks = max(len(images)-L+1, 0)
+    predictions = np.zeros((nb_stacks, num_features), dtype=np.float32)
+    truth = np.full((nb_stacks, 1), ground_truth, dtype=np.float32)
+    for b, flow in stack_batches(images, L, flow_mean, extraction_batch_size):
+        predictions[b:b+len(flow), ...] = feature_extractor.predict(flow,
+			 batch_size=len(flow))
     return predictions, truth
             
 def main():
@@ -375,13 +381,12 @@ def main():
     model.compile(optimizer=adam, loss='categorical_crossentropy',
 		  metrics=['accuracy'])
   
-    h5features = h5py.File(features_file, 'r')
+ 
+    # Only the labels are needed to build the folds, each fold
+    # reads its own feature vectors
     h5labels = h5py.File(labels_file, 'r')
-    
-    # X_full will contain all the feature vectors extracted
-    # from optical flow images
-    X_full = h5features[features_key]
     _y_full = np.asarray(h5labels[labels_key])
+    h5labels.close()
     
     zeroes_full = np.asarray(np.where(_y_full==0)[0])
     ones_full = np.asarray(np.where(_y_full==1)[0])
@@ -390,248 +395,68 @@ def main():
     
     # Use a 5 fold cross-validation
     kf_falls = KFold(n_splits=5, shuffle=True)
-    kf_falls.get_n_splits(X_full[zeroes_full, ...])
-    
     kf_nofalls = KFold(n_splits=5, shuffle=True)
-    kf_nofalls.get_n_splits(X_full[ones_full, ...])        
 
-    sensitivities = []
-    specificities = []
-    fars = []
-    mdrs = []
-    accuracies = []
-        
-    fold_number = 1
     # CROSS-VALIDATION: Stratified partition of the dataset into
-    # train/test sets
+    # train/test sets, as rows of the features file. The folds are
+    # then trained in parallel, each in its own process
+    folds = []
     for ((train_index_falls, test_index_falls),
     (train_index_nofalls, test_index_nofalls)) in zip(
-        kf_falls.split(X_full[zeroes_full, ...]),
-        kf_nofalls.split(X_full[ones_full, ...])
+        kf_falls.split(zeroes_full),
+        kf_nofalls.split(ones_full)
     ):
-
-        train_index_falls = np.asarray(train_index_falls)
-        test_index_falls = np.asarray(test_index_falls)
-        train_index_nofalls = np.asarray(train_index_nofalls)
-        test_index_nofalls = np.asarray(test_index_nofalls)
-
-        X = np.concatenate((
-            X_full[zeroes_full, ...][train_index_falls, ...],
-            X_full[ones_full, ...][train_index_nofalls, ...]
-        ))
-        _y = np.concatenate((
-            _y_full[zeroes_full, ...][train_index_falls, ...],
-            _y_full[ones_full, ...][train_index_nofalls, ...]
-        ))
-        X_test = np.concatenate((
-            X_full[zeroes_full, ...][test_index_falls, ...],
-            X_full[ones_full, ...][test_index_nofalls, ...]
+        train_falls = zeroes_full[train_index_falls]
+        train_nofalls = ones_full[train_index_nofalls]
+        test_rows = np.concatenate((
+            zeroes_full[test_index_falls],
+            ones_full[test_index_nofalls]
         ))
-        y_test = np.concatenate((
-            _y_full[zeroes_full, ...][test_index_falls, ...],
-            _y_full[ones_full, ...][test_index_nofalls, ...]
-        ))   
 
+        val_rows = None
         if use_validation:
             # Create a validation subset from the training set
-            zeroes = np.asarray(np.where(_y==0)[0])
-            ones = np.asarray(np.where(_y==1)[0])
-            
-            zeroes.sort()
-            ones.sort()
-
             trainval_split_0 = StratifiedShuffleSplit(n_splits=1,
                             test_size=int(val_size/2),
                             random_state=7)
-            indices_0 = trainval_split_0.split(X[zeroes,...],
-                            np.argmax(_y[zeroes,...], 1))
+            indices_0 = trainval_split_0.split(train_falls,
+                            np.zeros(len(train_falls)))
             trainval_split_1 = StratifiedShuffleSplit(n_splits=1,
                             test_size=int(val_size/2),
                             random_state=7)
-            indices_1 = trainval_split_1.split(X[ones,...],
-                            np.argmax(_y[ones,...], 1))
+            indices_1 = trainval_split_1.split(train_nofalls,
+                            np.zeros(len(train_nofalls)))
             train_indices_0, val_indices_0 = next(indices_0)
             train_indices_1, val_indices_1 = next(indices_1)
 
-            X_train = np.concatenate([X[zeroes,...][train_indices_0,...],
-                        X[ones,...][train_indices_1,...]],axis=0)
-            y_train = np.concatenate([_y[zeroes,...][train_indices_0,...],
-                        _y[ones,...][train_indices_1,...]],axis=0)
-            X_val = np.concatenate([X[zeroes,...][val_indices_0,...],
-                        X[ones,...][val_indices_1,...]],axis=0)
-            y_val = np.concatenate([_y[zeroes,...][val_indices_0,...],
-                        _y[ones,...][val_indices_1,...]],axis=0)
-        else:
-            X_train = X
-            y_train = _y
+            val_rows = np.concatenate([train_falls[val_indices_0],
+                        train_nofalls[val_indices_1]])
+            train_falls = train_falls[train_indices_0]
+            train_nofalls = train_nofalls[train_indices_1]
     
         # Balance the number of positive and negative samples so that
         # there is the same amount of each of them
-        all0 = np.asarray(np.where(y_train==0)[0])
-        all1 = np.asarray(np.where(y_train==1)[0])  
-
-        if len(all0) < len(all1):
-            all1 = np.random.choice(all1, len(all0), replace=False)
+        if len(train_falls) < len(train_nofalls):
+            train_nofalls = np.random.choice(train_nofalls, len(train_falls), replace=False)
         else:
-            all0 = np.random.choice(all0, len(all1), replace=False)
-        allin = np.concatenate((all0.flatten(),all1.flatten()))
-        allin.sort()
-        X_train = X_train[allin,...]
-        y_train = y_train[allin]
-    
-        # ==================== CLASSIFIER ========================
-        extracted_features = Input(shape=(num_features,),
-                    dtype='float32', name='input')
-        if batch_norm:
-            x = BatchNormalization(axis=-1, momentum=0.99,
-                    epsilon=0.001)(extracted_features)
-            x = Activation('relu')(x)
-        else:
-            x = ELU(alpha=1.0)(extracted_features)
-        
-        x = Dropout(0.9)(x)
-        x = Dense(4096, name='fc2', kernel_initializer='glorot_uniform')(x)
-        if batch_norm:
-            x = BatchNormalization(axis=-1, momentum=0.99, epsilon=0.001)(x)
-            x = Activation('relu')(x)
-        else:
-            x = ELU(alpha=1.0)(x)
-        x = Dropout(0.8)(x)
-        x = Dense(1, name='predictions',
-                    kernel_initializer='glorot_uniform')(x)
-        x = Activation('sigmoid')(x)
-        
-        classifier = Model(inputs=extracted_features,
-                outputs=x, name='classifier')
-        fold_best_model_path = best_model_path + 'urfd_fold_{}_{}.h5py'.format(
-                                epochs, fold_number)
-        classifier.compile(optimizer=adam, loss='binary_crossentropy',
-                metrics=['accuracy'])
-
-        if not use_checkpoint:
-            # ==================== TRAINING ========================     
-            # weighting of each class: only the fall class gets
-            # a different weight
-            class_weight = {0: weight_0, 1: 1}
-
-            callbacks = None
-            if use_validation:
-                # callback definition
-                metric = 'val_loss'
-                e = EarlyStopping(monitor=metric, min_delta=0, patience=100,
-                        mode='auto')
-                c = ModelCheckpoint(fold_best_model_path, monitor=metric,
-                            save_best_only=True,
-                            save_weights_only=False, mode='auto', verbose=1)
-                callbacks = [e, c]
-            validation_data = None
-            if use_validation:
-                validation_data = (X_val,y_val)
-            _mini_batch_size = mini_batch_size
-            if mini_batch_size == 0:
-                _mini_batch_size = X_train.shape[0]
-
-            history = classifier.fit(
-                X_train, y_train, 
-                validation_data=validation_data,
-                batch_size=_mini_batch_size,
-                epochs=epochs,
-                shuffle=True,
-                class_weight=class_weight,
-                callbacks=callbacks
-            )
-
-            if not use_validation:
-                classifier.save(fold_best_model_path)
-
-            plot_training_info(plots_folder + exp, ['accuracy', 'loss'],
-                    save_plots, history.history)
+            train_falls = np.random.choice(train_falls, len(train_nofalls), replace=False)
+        train_rows = np.concatenate((train_falls, train_nofalls))
 
-            if use_validation and use_val_for_training:
-                print("Using validation for training...")
-                classifier = load_model(fold_best_model_path)
+        folds.append((train_rows, val_rows, test_rows))
 
-                # Use full training set (training+validation)
-                X_train = np.concatenate((X_train, X_val), axis=0)
-                y_train = np.concatenate((y_train, y_val), axis=0)
+    fold_results = run_folds(train_fold, folds, cv_workers,
+                    cv_threads_per_fold, cv_seed)
+    fold_metrics = [metrics for metrics, _, _ in fold_results]
 
-                history = classifier.fit(
-                    X_train, y_train, 
-                    validation_data=validation_data,
-                    batch_size=_mini_batch_size,
-                    epochs=epochs,
-                    shuffle='batch',
-                    class_weight=class_weight,
-                    callbacks=callbacks
-                )
+    results = update_results('./plots/results.json', str(epochs),
+                    summarize_folds(fold_metrics))
 
-                classifier.save(fold_best_model_path)
-
-        # ==================== EVALUATION ========================     
-        
-        # Load best model
-        print('Model loaded from checkpoint')
-        classifier = load_model(fold_best_model_path)
-
-        predicted = classifier.predict(np.asarray(X_test))
-        for i in range(len(predicted)):
-            if predicted[i] < threshold:
-                predicted[i] = 0
-            else:
-                predicted[i] = 1
-        # Array of predictions 0/1
-        predicted = np.asarray(predicted).astype(int)   
-        # Compute metrics and print them
-        cm = confusion_matrix(y_test, predicted,labels=[0,1])
-        tp = cm[0][0]
-        fn = cm[0][1]
-        fp = cm[1][0]
-        tn = cm[1][1]
-        tpr = tp/float(tp+fn)
-        fpr = fp/float(fp+tn)
-        fnr = fn/float(fn+tp)
-        tnr = tn/float(tn+fp)
-        precision = tp/float(tp+fp)
-        recall = tp/float(tp+fn)
-        specificity = tn/float(tn+fp)
-        f1 = 2*float(precision*recall)/float(precision+recall)
-        accuracy = accuracy_score(y_test, predicted)
-        
-        print('FOLD {} results:'.format(fold_number))
-        print('True Positive: {}, True Negative: {}, False Positive: {}, False Negative: {}'.format(tp,tn,fp,fn))
-        print('True Positive Rate: {}, True Negative Rate: {}, False Positive Rate: {}, False Negative Rate: {}'.format(
-                        tpr,tnr,fpr,fnr))   
-        print('Sensitivity/Recall: {}'.format(recall))
-        print('Specificity: {}'.format(specificity))
-        print('Precision: {}'.format(precision))
-        print('F1-measure: {}'.format(f1))
-        print('Accuracy: {}'.format(accuracy))
-        
-        # Store the metrics for this epoch
-        sensitivities.append(tp/float(tp+fn))
-        specificities.append(tn/float(tn+fp))
-        fars.append(fpr)
-        mdrs.append(fnr)
-        accuracies.append(accuracy)
-        fold_number += 1
-
-    with open('./plots/results.json', "r") as f:
-        results = json.load(f)
-
-    if not results:
-        results = {}
-    
-    results[str(epochs)] = {}
-    results[str(epochs)]["sensitivity_mean"] = np.mean(sensitivities)*100.
-    results[str(epochs)]["sensitivity_std_dev"] = np.std(sensitivities)*100.
-    results[str(epochs)]["specificity_mean"] = np.mean(specificities)*100.
-    results[str(epochs)]["specificity_std_dev"] = np.std(specificities)*100.
-    results[str(epochs)]["far_mean"] = np.mean(fars)*100.
-    results[str(epochs)]["far_std_dev"] = np.std(fars)*100.
-    results[str(epochs)]["mdr_mean"] = np.mean(mdrs)*100.
-    results[str(epochs)]["mdr_std_dev"] = np.std(mdrs)*100.
-    results[str(epochs)]["accuracy_mean"] = np.mean(accuracies)*100.
-    results[str(epochs)]["accuracy_std_dev"] = np.std(accuracies)*100.
+    # ROC/PR summaries and the best F1 threshold over all out-of-fold outputs
+    fold_probabilities = np.concatenate([p for _, p, _ in fold_results])
+    fold_labels = np.concatenate([y for _, _, y in fold_results])
+    results[str(epochs)]["roc_auc"] = roc_curve(fold_probabilities, fold_labels)[3]
+    results[str(epochs)]["average_precision"] = pr_curve(fold_probabilities, fold_labels)[3]
+    results[str(epochs)]["best_threshold"] = best_threshold(fold_probabilities, fold_labels)[0]
     with open('./plots/results.json', "w") as f:
         json.dump(results, f, indent=4)
 
@@ -641,6 +466,130 @@ def main():
     print("FAR: %.2f%% (+/- %.2f%%)" % (results[str(epochs)]["far_mean"], results[str(epochs)]["far_std_dev"]))
     print("MDR: %.2f%% (+/- %.2f%%)" % (results[str(epochs)]["mdr_mean"], results[str(epochs)]["mdr_std_dev"]))
     print("Accuracy: %.2f%% (+/- %.2f%%)" % (results[str(epochs)]["accuracy_mean"], results[str(epochs)]["accuracy_std_dev"]))
+    print("ROC AUC: %.4f, average precision: %.4f, best F1 threshold: %.4f" % (results[str(epochs)]["roc_auc"],
+        results[str(epochs)]["average_precision"], results[str(epochs)]["best_threshold"]))
+
+def train_fold(fold_number, train_rows, val_rows, test_rows):
+    '''
+    Trains a fresh classifier on one cross-validation fold and evaluates
+    it on the fold's test rows, run in its own process by run_folds.
+    Returns the fold metrics, the classifier outputs and the test labels
+    '''
+    h5features = h5py.File(features_file, 'r')
+    h5labels = h5py.File(labels_file, 'r')
+    X_full = h5features[features_key]
+    _y_full = h5labels[labels_key]
+
+    # h5py reads rows in increasing order
+    train_rows, test_rows = np.sort(train_rows), np.sort(test_rows)
+    X_train, y_train = X_full[train_rows, ...], _y_full[train_rows, ...]
+    X_test, y_test = X_full[test_rows, ...], _y_full[test_rows, ...]
+    if val_rows is not None:
+        val_rows = np.sort(val_rows)
+        X_val, y_val = X_full[val_rows, ...], _y_full[val_rows, ...]
+    h5features.close()
+    h5labels.close()
+
+    # ==================== CLASSIFIER ========================
+    adam = Adam(lr=learning_rate, beta_1=0.9, beta_2=0.999,
+		epsilon=1e-08)
+    extracted_features = Input(shape=(num_features,),
+                dtype='float32', name='input')
+    if batch_norm:
+        x = BatchNormalization(axis=-1, momentum=0.99,
+                epsilon=0.001)(extracted_features)
+        x = Activation('relu')(x)
+    else:
+        x = ELU(alpha=1.0)(extracted_features)
+    
+    x = Dropout(0.9)(x)
+    x = Dense(4096, name='fc2', kernel_initializer='glorot_uniform')(x)
+    if batch_norm:
+        x = BatchNormalization(axis=-1, momentum=0.99, epsilon=0.001)(x)
+        x = Activation('relu')(x)
+    else:
+        x = ELU(alpha=1.0)(x)
+    x = Dropout(0.8)(x)
+    x = Dense(1, name='predictions',
+                kernel_initializer='glorot_uniform')(x)
+    x = Activation('sigmoid')(x)
+    
+    classifier = Model(inputs=extracted_features,
+            outputs=x, name='classifier')
+    fold_best_model_path = best_model_path + 'urfd_fold_{}_{}.h5py'.format(
+                            epochs, fold_number)
+    classifier.compile(optimizer=adam, loss='binary_crossentropy',
+            metrics=['accuracy'])
+
+    if not use_checkpoint:
+        # ==================== TRAINING ========================     
+        # weighting of each class: only the fall class gets
+        # a different weight
+        class_weight = {0: weight_0, 1: 1}
+
+        callbacks = None
+        if use_validation:
+            # callback definition
+            metric = 'val_loss'
+            e = EarlyStopping(monitor=metric, min_delta=0, patience=100,
+                    mode='auto')
+            c = ModelCheckpoint(fold_best_model_path, monitor=metric,
+                        save_best_only=True,
+                        save_weights_only=False, mode='auto', verbose=1)
+            callbacks = [e, c]
+        validation_data = None
+        if use_validation:
+            validation_data = (X_val,y_val)
+        _mini_batch_size = mini_batch_size
+        if mini_batch_size == 0:
+            _mini_batch_size = X_train.shape[0]
+
+        history = classifier.fit(
+            X_train, y_train, 
+            validation_data=validation_data,
+            batch_size=_mini_batch_size,
+            epochs=epochs,
+            shuffle=True,
+            class_weight=class_weight,
+            callbacks=callbacks
+        )
+
+        if not use_validation:
+            classifier.save(fold_best_model_path)
+
+        plot_training_info(plots_folder + exp + 'fold{}_'.format(fold_number),
+                ['accuracy', 'loss'], save_plots, history.history)
+
+        if use_validation and use_val_for_training:
+            print("Using validation for training...")
+            classifier = load_model(fold_best_model_path)
+
+            # Use full training set (training+validation)
+            X_train = np.concatenate((X_train, X_val), axis=0)
+            y_train = np.concatenate((y_train, y_val), axis=0)
+
+            history = classifier.fit(
+                X_train, y_train, 
+                validation_data=validation_data,
+                batch_size=_mini_batch_size,
+                epochs=epochs,
+                shuffle='batch',
+                class_weight=class_weight,
+                callbacks=callbacks
+            )
+
+            classifier.save(fold_best_model_path)
+
+    # ==================== EVALUATION ========================     
+    
+    # Load best model
+    print('Model loaded from checkpoint')
+    classifier = load_model(fold_best_model_path)
+
+    probabilities = classifier.predict(np.asarray(X_test))
+    metrics = binary_metrics(probabilities, y_test, threshold)
+    print_metrics(metrics, 'FOLD {} results:'.format(fold_number))
+    return metrics, probabilities.ravel(), np.asarray(y_test).ravel()
     
 if __name__ == '__main__':
     if not os.path.exists(best_model_path):
@@ -0,0 +1,182 @@
+import cv2
+import numpy as np
+
+def _identity_lut():
+    return np.arange(256, dtype=np.float64)
+
+def _to_lut(values):
+    # saturating float -> uint8, truncating like np.uint8 after a clip
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+def brightness_lut(delta):
+    """
+    lookup table of a saturating brightness change, same as cv2.add/cv2.subtract
+    with a constant image
+    """
+    return _to_lut(_identity_lut() + delta)
+
+def contrast_lut(contrast, brightness):
+    """
+    lookup table of a saturating contrast change:
+    x * (contrast/127 + 1) - contrast + brightness
+    """
+    return _to_lut(_identity_lut() * (contrast / 127 + 1) - contrast + brightness)
+
+def tall(frames):
+    """
+    method to view a contiguous (n, h, w, c) batch as one (n*h, w, c) image, for
+    the opencv calls where pixels or rows do not interact across frames
+    """
+    n, h, w, c = frames.shape
+    return np.ascontiguousarray(frames).reshape(n * h, w, c)
+
+def apply_lut(frames, lut):
+    return cv2.LUT(tall(frames), lut).reshape(frames.shape)
+
+def per_frame(fn, frames, shape=None):
+    """
+    method to run an opencv call on every frame of a batch, writing into a single
+    preallocated output batch, fn being called as fn(frame, dst)
+    """
+    out = np.empty((len(frames),) + (shape or frames.shape[1:]), dtype=frames.dtype)
+    for frame, dst in zip(frames, out):
+        fn(frame, dst)
+    return out
+
+def rotate(frames, angle, scale=1):
+    h, w = frames.shape[1:3]
+    # first param: rotate from center, second param: angle, third param: scale
+    rotation_matrix = cv2.getRotationMatrix2D((w/2, h/2), angle, scale)
+    return per_frame(lambda x, dst: cv2.warpAffine(x, rotation_matrix, (w, h), dst=dst), frames)
+
+def flip(frames):
+    # flipping the columns of the stacked frames flips every frame
+    return cv2.flip(tall(frames), 1).reshape(frames.shape)
+
+def box_blur(frames, size=3, passes=1):
+    def blur(x, dst):
+        for _ in range(passes):
+            x = cv2.blur(x, (size, size), dst=dst)
+    return per_frame(blur, frames)
+
+def sharpen(frames):
+    kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+    return per_frame(lambda x, dst: cv2.filter2D(x, -1, kernel, dst=dst), frames)
+
+def zoom(frames, factor):
+    h, w, c = frames.shape[1:]
+    x1, x2 = int(0.5 * w * (1 - 1/factor)), int(w - 0.5 * w * (1 - 1/factor))
+    y1, y2 = int(0.5 * h * (1 - 1/factor)), int(h - 0.5 * h * (1 - 1/factor))
+    size = (int(round((x2 - x1) * factor)), int(round((y2 - y1) * factor)))
+    return per_frame(lambda x, dst: cv2.resize(x[y1:y2, x1:x2], None, dst=dst, fx=factor, fy=factor),
+        frames, (size[1], size[0], c))
+
+def saturation(frames, delta):
+    """
+    saturating change of the HSV saturation of BGR frames, the whole batch is
+    converted and remapped with single opencv calls
+    """
+    lut = np.stack([np.arange(256, dtype=np.uint8), brightness_lut(delta), np.arange(256, dtype=np.uint8)], axis=-1)
+    hsv = cv2.LUT(cv2.cvtColor(tall(frames), cv2.COLOR_BGR2HSV), lut.reshape(256, 1, 3))
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR).reshape(frames.shape)
+
+# ops mapping pixel values one to one, consecutive ones are fused into a single table
+LUT_OPS = {
+    "brightness": lambda delta: brightness_lut(delta),
+    "contrast": lambda contrast, brightness=0: contrast_lut(contrast, brightness),
+}
+
+# ops working on whole (n, h, w, c) uint8 batches
+BATCH_OPS = {
+    "rotate": rotate,
+    "flip": flip,
+    "box_blur": box_blur,
+    "sharpen": sharpen,
+    "zoom": zoom,
+    "saturation": saturation,
+}
+
+def compile_chain(chain):
+    """
+    Turns a declarative transform chain into a function on frame batches.
+    Consecutive point operations are composed into one 256-entry lookup
+    table applied to the whole batch in one call, as are flips and colour
+    conversions; warps and filters share their parameters across the batch.
+    Input:
+    * chain: list of {"op": name, **params} dicts, applied in order, the names
+      being keys of LUT_OPS or BATCH_OPS
+    Output: function mapping a (n, h, w, c) uint8 batch to its augmented copy
+    """
+    steps = []
+    for transform in chain:
+        params = dict(transform)
+        op = params.pop("op")
+        if op in LUT_OPS:
+            lut = LUT_OPS[op](**params)
+            if steps and steps[-1][0] == "lut":
+                lut = lut[steps.pop()[1]]
+            steps.append(("lut", lut))
+        elif op in BATCH_OPS:
+            steps.append(("batch", (BATCH_OPS[op], params)))
+        else:
+            raise ValueError(f"Unknown augmentation {op}, expected one of {sorted({**LUT_OPS, **BATCH_OPS})}.")
+
+    def apply(frames):
+        for kind, step in steps:
+            if kind == "lut":
+                frames = apply_lut(frames, step)
+            else:
+                fn, params = step
+                frames = fn(frames, **params)
+        return frames
+    return apply
+
+class AugmentationEngine:
+    """
+    applies a list of declarative transform chains (see compile_chain) to batches
+    of uint8 frames, each chain giving one augmented copy of the batch
+    """
+    def __init__(self, chains):
+        self.chains = chains
+        self.compiled = [compile_chain(chain) for chain in chains]
+
+    def __len__(self):
+        return len(self.compiled)
+
+    def augment(self, frames, k):
+        """
+        method to get the copy of a (n, h, w, c) batch augmented by the kth chain
+        """
+        return self.compiled[k](frames)
+
+    def augment_all(self, frames):
+        """
+        method to get the copies of a batch augmented by every chain, in order
+        """
+        return [apply(frames) for apply in self.compiled]
+
+def sample_chain(policy, rng):
+    """
+    Draws a concrete chain from a random augmentation policy, in the spirit of
+    an albumentations Compose: every op of the policy is kept with its
+    probability p and each [low, high] parameter is drawn uniformly (as an
+    integer when both bounds are integers).
+    Input:
+    * policy: list of {"op": name, "p": probability, **params} dicts
+    * rng: numpy RandomState
+    Output: chain for compile_chain
+    """
+    chain = []
+    for transform in policy:
+        params = dict(transform)
+        if rng.rand() >= params.pop("p", 1.0):
+            continue
+        for key, value in params.items():
+            if isinstance(value, (list, tuple)):
+                low, high = value
+                if isinstance(low, int) and isinstance(high, int):
+                    params[key] = int(rng.randint(low, high + 1))
+                else:
+                    params[key] = float(rng.uniform(low, high))
+        chain.append(params)
+    return chain
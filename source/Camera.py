@@ -1,31 +1,46 @@
-import os
 import cv2
-import yaml
 import time
-from collections import deque
+import numpy as np
+import signal
 from .Detector import FallDetector
-from multiprocessing import Process
-from threading import Thread, Lock
+from .FlowBuffer import FlowRingBuffer
+from .OpticalFlow import create_flow_engine
+from .Resizer import FrameResizer
+from .Scheduler import DetectionScheduler
+from .SharedFrames import SharedFrameRing
+from multiprocessing import Process, Event
+from threading import Thread
 
 class Camera(Process):
-    def __init__(self, index, queue):
+    def __init__(self, index, queue, config, client=None, stop_event=None):
         super().__init__()
-        with open('../config.yaml', "r") as f:
-            self.config = yaml.safe_load(f)
-
-        self.detector = FallDetector(self.config)
-        self.index = self.config["camera_index"]
+        self.config = config
+        self.detector = FallDetector(self.config, client)
+        self.flow_engine = create_flow_engine(self.config)
+        # index is anything cv2.VideoCapture accepts: device index, video file or stream url
+        self.index = index
         self.queue = queue
-        self.w = 224
-        self.h = 224
-        self.count = 0
+        self.stop_event = stop_event if stop_event is not None else Event()
+        self.w = self.config["frame_size"]
+        self.h = self.config["frame_size"]
+        self.resize = FrameResizer(self.w, self.h, self.config["resize_interpolation"])
         self.timer = time.time()
 
-        # initialize detection thread
-        self.mutex = Lock()
-        self.detect_thread = Thread(target=self.detect)
+        # flow frames shared between the capture and detection threads, or through
+        # shared memory with any other process attaching to the ring by name
+        if self.config["shared_frame_transport"]:
+            self.flow_buffer = SharedFrameRing(self.config["sliding_window_length"], self.h, self.w)
+        else:
+            self.flow_buffer = FlowRingBuffer(self.config["sliding_window_length"], self.h, self.w)
+        self.scheduler = DetectionScheduler(self.flow_buffer, self.config["detection_stride"])
+
+        # initialize detection thread, it ends together with the capture loop
+        self.detect_thread = Thread(target=self.detect, daemon=True)
         
     def run(self):
+        # shutdown is requested through stop_event, SIGTERM only comes from terminate()
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
         # start persistent detection thread
         self.detect_thread.start()
 
@@ -36,46 +51,39 @@ class Camera(Process):
         ret, frame = self.cap.read()
         if ret:
             print(f"Video capture on {self.index} successful.")
+            # frames are resized in turn into two buffers, the current and the previous one
+            frames = [np.empty((self.h, self.w, 3), dtype=np.uint8) for _ in range(2)]
+            prev_frame = self.resize(frame, frames[0])
+            nb_frame = 1
         else:
             print(f"Video capture on {self.index} failed.")
             self.cap.release()
 
-        while self.cap.isOpened():
+        while self.cap.isOpened() and not self.stop_event.is_set():
             ret, frame = self.cap.read()
             
             if ret:
-                path = self.config["output_path"] + "raw_img_" + str(self.count);
-                flow_x = self.config["flow_path"] + "flow_x/flow_img_" + str(self.count)
-                flow_y = self.config["flow_path"] + "flow_y/flow_img_" + str(self.count)
-                cv2.resize(frame, (self.w, self.h))
-                cv2.imwrite(frame, path)
-                os.system('/home/denise/dense_flow/build/extract_cpu -f={} -x={} -y={} -i=tmp/image -b=20 -t=1 -d=0 -s=1 -o=dir'.format(path, flow_x, flow_y))
-                
-                # increment count
-                self.mutex.acquire()
-                self.count += 1
-                if self.count == 10:
-                    self.count = 0
-                self.mutex.release()
-
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
+                # compute optical flow in-process against the previous frame
+                frame = self.resize(frame, frames[nb_frame % 2])
+                nb_frame += 1
+                img_x, img_y = self.flow_engine.compute(prev_frame, frame)
+                prev_frame = frame
+                self.flow_buffer.write(img_x, img_y, frame)
             else:
                 print("Video capturing stopped.")
                 break
 
         self.cap.release()
-        cv2.destroyAllWindows()
     
     def detect(self):
-        while True:
-            # get count
-            self.mutex.acquire()
-            count = self.count
-            self.mutex.release()
+        while not self.stop_event.is_set():
+            # sleep until a new window is due, stale windows are skipped rather than queued
+            frames = self.scheduler.next_window(timeout=1.0)
+            if frames is None:
+                continue
 
             # detect
-            result = self.detector.detect(count)
+            result = self.detector.detect(frames)
 
             # possible fall detected, alert monitoring process
             if result:
@@ -83,8 +91,17 @@ class Camera(Process):
                 self.queue.put(elem)
             else:
                 if (time.time() - self.timer) > self.config["persistent_update"]:
-                    # persistence message
-                    elem = (self.index, False)
+                    # persistence message, carries the gating and scheduling statistics
+                    stats = self.detector.stats()
+                    stats.update(self.scheduler.stats())
+                    elem = (self.index, False, stats)
                     self.queue.put(elem)
                     self.timer = time.time()
 
+    def release_transport(self):
+        """
+        method to release the shared frame ring once the camera process has exited,
+        Process.close() still has to be called for the process itself
+        """
+        if isinstance(self.flow_buffer, SharedFrameRing):
+            self.flow_buffer.unlink()
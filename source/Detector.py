@@ -1,61 +1,78 @@
-import gc
-import cv2
+import time
 import numpy as np
 import scipy.io as sio
-from .Model import Model
+from collections import deque
+from .FlowStacks import stack_shape
+from .OpticalFlow import motion_energy
 
 class FallDetector:
-    def __init__(self, config):
-        self.model = Model(config)
+    def __init__(self, config, client=None):
+        # with an inference server client the network lives in the server process,
+        # TensorFlow is then never imported in the camera process
+        self.client = client
+        self.model = None
+        if client is None:
+            from .Model import create_model
+            self.model = create_model(config)
         self.config = config
+        self.length = self.config["sliding_window_length"]
 
-    def detect(self, end_idx):
+        # load the mean flow stack once, the window is kept in float32
+        d = sio.loadmat(self.config["mean_file"])
+        self.flow_mean = d['image_mean'].astype(np.float32)
+        if self.flow_mean.shape != stack_shape(self.config):
+            raise ValueError(f"The flow mean of {self.config['mean_file']} has shape {self.flow_mean.shape}, "
+                f"a frame_size of {self.config['frame_size']} needs one of shape {stack_shape(self.config)}.")
+
+        # when a pair moves from channels 2s+2, 2s+3 down to 2s, 2s+1 its
+        # mean-subtracted value changes by the difference of the channel means
+        self.mean_shift = self.flow_mean[..., 2:] - self.flow_mean[..., :-2]
+
+        # mean-subtracted sliding window stack, newest pair in the last two channels
+        self.stack = -self.flow_mean
+
+        # motion gating: per-frame motion energy of the frames in the window
+        self.energies = deque(maxlen=self.length)
+        self.last_inference = 0
+        self.windows_total = 0
+        self.windows_skipped = 0
+
+    def detect(self, frames):
         # optical flow pipeline
-        features = self.get_features(end_idx)
+        for frame in frames:
+            self.push(frame)
+            self.energies.append(motion_energy(frame[..., 0], frame[..., 1],
+                self.config["flow_bound"], self.config["motion_min_magnitude"]))
+
+        # skip the CNN on static windows, apart from a low-rate heartbeat inference
+        self.windows_total += 1
+        if (max(self.energies) < self.config["motion_threshold"] and
+                time.time() - self.last_inference < self.config["motion_heartbeat"]):
+            self.windows_skipped += 1
+            return False
+        self.last_inference = time.time()
 
         # model prediction pipeline
-        return self.model.predict(features)
+        if self.client is not None:
+            try:
+                return self.client.infer(self.stack)
+            except TimeoutError as e:
+                # the window is skipped, the supervisor handles a dead server
+                print(e)
+                return False
+        _, result = self.model.infer(self.stack)
+        return result
+
+    def stats(self):
+        return {"windows_total": self.windows_total, "windows_skipped": self.windows_skipped}
 
-    def get_features(self, end_idx):
+    def push(self, frame):
         """
-        method containing optical flow processing pipline on sliding window frames
+        method to add a new (h, w, 2) uint8 flow pair to the sliding window stack,
+        the pair is mean-subtracted once and the older pairs shift down one position
         """
-        #get sliding window frames
-        x_frames = []
-        y_frames = []
-        d = sio.loadmat(self.config["mean_file"])
-        flow_mean = d['image_mean']
-        flow = np.zeros(shape=(224, 224, 2 * self.config["sliding_window_length"], 1), dtype=np.float64)
-
-        for i in range(self.config["sliding_window_length"]):
-            flow_x_file = self.config["flow_path"] + "flow_x/flow_img_" + str(end_idx)
-            flow_y_file = self.config["flow_path"] + "flow_y/flow_img_" + str(end_idx)
-            img_x = cv2.imread(flow_x_file, cv2.IMREAD_GRAYSCALE)
-            img_y = cv2.imread(flow_y_file, cv2.IMREAD_GRAYSCALE)
-
-            # Assign an image i to the jth stack in the kth position, but also
-            # in the j+1th stack in the k+1th position and so on	
-            # (for sliding window) 
-            for s in list(reversed(range(min(10,i+1)))):
-                if i-s < 1:
-                    flow[:,:,2*s,  i-s] = img_x
-                    flow[:,:,2*s+1,i-s] = img_y
-            
-            del img_x,img_y
-            gc.collect()
-
-            end_idx -= 1
-            if end_idx < 0:
-                end_idx = self.config["sliding_window_length"] - 1
-
-        # Subtract mean
-        flow = flow - np.tile(flow_mean[..., np.newaxis], (1, 1, 1, flow.shape[3]))
-        flow = np.transpose(flow, (3, 0, 1, 2))
-        predictions = np.zeros((flow.shape[0], self.config("num_features")), dtype=np.float64)
-
-        # Process each stack: do the feed-forward pass
-        for i in range(flow.shape[0]):
-            prediction = self.model.model.predict(np.expand_dims(flow[i, ...], 0))
-            predictions[i, ...] = prediction
-            
-        return predictions
+        for s in range(self.length - 1):
+            np.add(self.stack[..., 2*s+2:2*s+4], self.mean_shift[..., 2*s:2*s+2],
+                out=self.stack[..., 2*s:2*s+2])
+        np.subtract(frame, self.flow_mean[..., -2:], out=self.stack[..., -2:])
+
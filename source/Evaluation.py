@@ -0,0 +1,124 @@
+import numpy as np
+
+def binary_metrics(probabilities, labels, thresholds):
+    """
+    Computes the detection metrics of classifier outputs for any number of
+    thresholds at once. As in the rest of the project a fall is class 0 and
+    is predicted when the output is below the threshold, so falls are the
+    positives. Both label groups are sorted once and every threshold is
+    counted with a binary search, no per-sample Python loop.
+    Input:
+    * probabilities: classifier outputs (the 'no fall' probability), shape (n,) or (n, 1)
+    * labels: ground truth, 0 for fall and 1 for no fall
+    * thresholds: a single threshold or an array of them
+    Output: dict with tp, tn, fp, fn, tpr, tnr, fpr, fnr, precision, recall,
+    specificity, f1 and accuracy, each a scalar or an array like thresholds
+    """
+    probabilities = np.asarray(probabilities, dtype=np.float64).ravel()
+    labels = np.asarray(labels).ravel()
+    single = np.ndim(thresholds) == 0
+    thresholds = np.atleast_1d(np.asarray(thresholds, dtype=np.float64))
+
+    falls = np.sort(probabilities[labels == 0])
+    no_falls = np.sort(probabilities[labels == 1])
+
+    # number of samples of each class predicted as a fall, i.e. below the threshold
+    tp = np.searchsorted(falls, thresholds, side='left')
+    fp = np.searchsorted(no_falls, thresholds, side='left')
+    fn = len(falls) - tp
+    tn = len(no_falls) - fp
+
+    metrics = {
+        "tp": tp, "tn": tn, "fp": fp, "fn": fn,
+        "tpr": _ratio(tp, tp + fn),
+        "tnr": _ratio(tn, tn + fp),
+        "fpr": _ratio(fp, fp + tn),
+        "fnr": _ratio(fn, fn + tp),
+        "precision": _ratio(tp, tp + fp),
+        "accuracy": _ratio(tp + tn, len(probabilities)),
+    }
+    metrics["recall"] = metrics["tpr"]
+    metrics["specificity"] = metrics["tnr"]
+    metrics["f1"] = _ratio(2 * tp, 2 * tp + fp + fn)
+
+    if single:
+        return {key: value[0].item() for key, value in metrics.items()}
+    return metrics
+
+def _ratio(numerator, denominator):
+    # nan where the rate is undefined, e.g. precision when nothing is predicted as a fall
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.broadcast_to(np.asarray(denominator, dtype=np.float64), numerator.shape)
+    ratio = np.full(numerator.shape, np.nan)
+    np.divide(numerator, denominator, out=ratio, where=denominator > 0)
+    return ratio
+
+def curve_thresholds(probabilities):
+    """
+    every threshold at which a decision changes: the distinct outputs, plus
+    one above them all so that every sample is predicted as a fall
+    """
+    return np.append(np.unique(np.asarray(probabilities, dtype=np.float64)), np.inf)
+
+def roc_curve(probabilities, labels):
+    """
+    method to compute the ROC curve with falls as positives, returns the false
+    positive rates, true positive rates, thresholds (increasing) and the area under the curve
+    """
+    thresholds = curve_thresholds(probabilities)
+    metrics = binary_metrics(probabilities, labels, thresholds)
+    fpr, tpr = metrics["fpr"], metrics["tpr"]
+    area = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    return fpr, tpr, thresholds, area
+
+def pr_curve(probabilities, labels):
+    """
+    method to compute the precision/recall curve with falls as positives, returns
+    the precisions, recalls, thresholds (increasing) and the average precision
+    """
+    thresholds = curve_thresholds(probabilities)
+    metrics = binary_metrics(probabilities, labels, thresholds)
+    precision, recall = metrics["precision"], metrics["recall"]
+
+    # thresholds below every output predict nothing, their precision is undefined
+    defined = ~np.isnan(precision)
+    precision, recall, thresholds = precision[defined], recall[defined], thresholds[defined]
+    average_precision = float(np.sum(np.diff(recall, prepend=0.0) * precision))
+    return precision, recall, thresholds, average_precision
+
+def best_threshold(probabilities, labels, metric="f1", thresholds=None):
+    """
+    Sweeps the thresholds and returns the one maximizing the chosen metric,
+    together with all the metrics at that threshold.
+    Input:
+    * probabilities: classifier outputs
+    * labels: ground truth, 0 for fall and 1 for no fall
+    * metric: any key of binary_metrics, or 'youden' for tpr - fpr
+    * thresholds: candidate thresholds, by default every distinct output
+    """
+    if thresholds is None:
+        thresholds = curve_thresholds(probabilities)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    metrics = binary_metrics(probabilities, labels, thresholds)
+
+    if metric == "youden":
+        scores = metrics["tpr"] - metrics["fpr"]
+    else:
+        scores = metrics[metric]
+    best = int(np.nanargmax(scores))
+    return float(thresholds[best]), {key: value[best].item() for key, value in metrics.items()}
+
+def print_metrics(metrics, title=None):
+    """
+    method to print the metrics of binary_metrics at a single threshold
+    """
+    if title is not None:
+        print(title)
+        print('-'*10)
+    print('TP: {}, TN: {}, FP: {}, FN: {}'.format(metrics["tp"], metrics["tn"], metrics["fp"], metrics["fn"]))
+    print('TPR: {}, TNR: {}, FPR: {}, FNR: {}'.format(metrics["tpr"], metrics["tnr"], metrics["fpr"], metrics["fnr"]))
+    print('Sensitivity/Recall: {}'.format(metrics["recall"]))
+    print('Specificity: {}'.format(metrics["specificity"]))
+    print('Precision: {}'.format(metrics["precision"]))
+    print('F1-measure: {}'.format(metrics["f1"]))
+    print('Accuracy: {}'.format(metrics["accuracy"]))
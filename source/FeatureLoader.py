@@ -0,0 +1,119 @@
+import numpy as np
+import tensorflow as tf
+
+class H5Features:
+    """
+    out-of-core view over one or more (features, labels) h5py dataset pairs,
+    concatenated in the given order. Only the labels are loaded in memory,
+    feature rows are read on demand in contiguous slices of at most
+    block_rows rows, so a dataset never has to fit in RAM
+    """
+    def __init__(self, pairs, block_rows=4096):
+        self.features = [features for features, _ in pairs]
+        self.block_rows = block_rows
+        self.num_features = self.features[0].shape[1]
+
+        # global row -> (segment, row within the segment)
+        lengths = [len(features) for features in self.features]
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self.labels = np.concatenate([np.asarray(labels) for _, labels in pairs], axis=0)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def blocks(self, indices):
+        """
+        method to split global row indices into contiguous read blocks, returns a list
+        of (segment, start, stop, rows) where rows are the sorted rows to keep in the block
+        """
+        indices = np.sort(np.asarray(indices, dtype=np.int64))
+        segments = np.searchsorted(self.offsets, indices, side='right') - 1
+        rows = indices - self.offsets[segments]
+        block_ids = rows // self.block_rows
+
+        # a new block starts wherever the segment or the block number changes
+        starts = np.flatnonzero(np.r_[True, (segments[1:] != segments[:-1]) | (block_ids[1:] != block_ids[:-1])])
+        ends = np.r_[starts[1:], len(indices)]
+        return [(segments[s], rows[s], rows[e-1] + 1, rows[s:e]) for s, e in zip(starts, ends)]
+
+    def read_block(self, block):
+        """
+        method to read the feature rows and labels of a block returned by blocks()
+        """
+        segment, start, stop, rows = block
+        features = self.features[segment][start:stop][rows - start]
+        labels = self.labels[self.offsets[segment] + rows]
+        return features.astype(np.float32), labels
+
+    def read(self, indices):
+        """
+        method to read the given rows into memory, in sorted order, meant for small
+        selections such as validation sets
+        """
+        parts = [self.read_block(block) for block in self.blocks(indices)]
+        if not parts:
+            return np.zeros((0, self.num_features), dtype=np.float32), self.labels[:0]
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+def stream_batches(selections, batch_size, shuffle=True, buffer_size=65536, seed=None):
+    """
+    Generator over (features, labels) batches of the selected rows, reading each
+    dataset in contiguous blocks. With shuffle the blocks are visited in random
+    order and rows are shuffled within a buffer of buffer_size rows, otherwise
+    rows come out sorted per dataset.
+    Input:
+    * selections: list of (H5Features, row indices) pairs
+    * batch_size: rows per batch
+    * shuffle: whether to shuffle blocks and rows
+    * buffer_size: number of rows kept in memory for shuffling
+    * seed: seed of the shuffling
+    """
+    rng = np.random.RandomState(seed)
+    blocks = [(data, block) for data, indices in selections for block in data.blocks(indices)]
+    if shuffle:
+        blocks = [blocks[i] for i in rng.permutation(len(blocks))]
+    else:
+        buffer_size = batch_size
+
+    buffered_x, buffered_y, nb_buffered = [], [], 0
+    for data, block in blocks:
+        features, labels = data.read_block(block)
+        buffered_x.append(features)
+        buffered_y.append(labels)
+        nb_buffered += len(features)
+        if nb_buffered < buffer_size:
+            continue
+
+        # emit every full batch of the buffer, keep the remainder for the next blocks
+        x, y = np.concatenate(buffered_x), np.concatenate(buffered_y)
+        if shuffle:
+            order = rng.permutation(len(x))
+            x, y = x[order], y[order]
+        nb_emitted = len(x) - len(x) % batch_size
+        for start in range(0, nb_emitted, batch_size):
+            yield x[start:start+batch_size], y[start:start+batch_size]
+        buffered_x, buffered_y, nb_buffered = [x[nb_emitted:]], [y[nb_emitted:]], len(x) - nb_emitted
+
+    if nb_buffered:
+        x, y = np.concatenate(buffered_x), np.concatenate(buffered_y)
+        if shuffle:
+            order = rng.permutation(len(x))
+            x, y = x[order], y[order]
+        for start in range(0, len(x), batch_size):
+            yield x[start:start+batch_size], y[start:start+batch_size]
+
+def make_dataset(selections, batch_size, shuffle=True, buffer_size=65536, seed=None):
+    """
+    method to wrap stream_batches in a prefetching tf.data.Dataset for Keras fit.
+    The generator restarts, with a new shuffle, on every epoch
+    """
+    num_features = selections[0][0].num_features
+    label_shape = selections[0][0].labels.shape[1:]
+    rng = np.random.RandomState(seed)
+
+    def generator():
+        return stream_batches(selections, batch_size, shuffle, buffer_size, rng.randint(2**31 - 1))
+
+    dataset = tf.data.Dataset.from_generator(generator, output_types=(tf.float32, tf.float32),
+        output_shapes=(tf.TensorShape([None, num_features]), tf.TensorShape([None]).concatenate(label_shape)))
+    return dataset.prefetch(2)
@@ -0,0 +1,63 @@
+import time
+import numpy as np
+from threading import Condition
+
+class FlowRingBuffer:
+    """
+    preallocated ring holding the last `length` quantized flow pairs, shape
+    (length, h, w, 2) uint8. There is a single writer (the capture thread);
+    readers never block it and instead use the sequence number to detect a
+    write that overlapped their copy, retrying until they get a clean window
+    """
+    def __init__(self, length, h=224, w=224):
+        self.length = length
+        self.buffer = np.zeros((length, h, w, 2), dtype=np.uint8)
+        # odd while a write is in progress, 2 * committed frames otherwise
+        self.seq = 0
+        # readers can sleep on this until new frames are committed
+        self.committed = Condition()
+
+    @property
+    def count(self):
+        return self.seq // 2
+
+    def write(self, flow_x, flow_y, frame=None):
+        """
+        method to commit a new flow pair, overwriting the oldest slot. The frame is
+        only kept by SharedFrameRing, it is accepted here so both are interchangeable
+        """
+        slot = self.count % self.length
+        self.seq += 1
+        self.buffer[slot, ..., 0] = flow_x
+        self.buffer[slot, ..., 1] = flow_y
+        self.seq += 1
+        with self.committed:
+            self.committed.notify_all()
+
+    def wait_for(self, count, timeout=None):
+        """
+        method to block until at least `count` frames have been committed,
+        returns False if the timeout expired first
+        """
+        with self.committed:
+            return self.committed.wait_for(lambda: self.count >= count, timeout)
+
+    def snapshot(self, since=0):
+        """
+        method to copy out a consistent set of the frames committed after
+        frame number `since` (at most one window), ordered oldest to newest
+        and returned together with the number of frames committed so far
+        """
+        while True:
+            seq = self.seq
+            if seq & 1:
+                time.sleep(0)
+                continue
+
+            count = seq // 2
+            nb_frames = min(count - since, self.length)
+            order = np.arange(count - nb_frames, count) % self.length
+            frames = self.buffer[order]
+
+            if self.seq == seq:
+                return frames, count
@@ -0,0 +1,77 @@
+import os
+import cv2
+import glob
+import numpy as np
+
+def stack_shape(config):
+    """
+    method to get the (h, w, 2*L) shape of the network's flow stacks, frames being
+    resized to config["frame_size"] squares
+    """
+    return (config["frame_size"], config["frame_size"], 2 * config["sliding_window_length"])
+
+def flow_image_files(folder):
+    """
+    method to list the sorted flow_x*/flow_y* jpg images of a folder, as many of each
+    """
+    x_images = sorted(glob.glob(os.path.join(folder, 'flow_x*.jpg')))
+    y_images = sorted(glob.glob(os.path.join(folder, 'flow_y*.jpg')))
+    nb_frames = min(len(x_images), len(y_images))
+    return x_images[:nb_frames], y_images[:nb_frames]
+
+def read_flow_images(folder, out=None):
+    """
+    method to read the flow images of a folder, each decoded once, into a single
+    interleaved (frames, h, w, 2) uint8 array, x then y. out, if given, is filled
+    instead of a new array (e.g. a FlowStore memmap)
+    """
+    x_images, y_images = flow_image_files(folder)
+    if out is None:
+        h, w = cv2.imread(x_images[0], cv2.IMREAD_GRAYSCALE).shape if x_images else (224, 224)
+        out = np.empty((len(x_images), h, w, 2), dtype=np.uint8)
+    for i, (flow_x_file, flow_y_file) in enumerate(zip(x_images, y_images)):
+        out[i, ..., 0] = cv2.imread(flow_x_file, cv2.IMREAD_GRAYSCALE)
+        out[i, ..., 1] = cv2.imread(flow_y_file, cv2.IMREAD_GRAYSCALE)
+    return out
+
+def sliding_windows(flow, length):
+    """
+    Zero-copy view of every sliding window of a video's flow. Window j holds the
+    frames j to j+length-1, oldest first, laid out so that flattening its last two
+    axes gives the network's stack channels (2s for x of frame s, 2s+1 for y).
+    Input:
+    * flow: (frames, h, w, 2) array, e.g. from read_flow_images or a FlowStore
+    * length: sliding window length L
+    Output: read-only (frames-length+1, h, w, length, 2) view of flow
+    """
+    nb_windows = max(len(flow) - length + 1, 0)
+    frame_stride, h_stride, w_stride, c_stride = flow.strides
+    return np.lib.stride_tricks.as_strided(flow, shape=(nb_windows,) + flow.shape[1:3] + (length, 2),
+        strides=(frame_stride, h_stride, w_stride, frame_stride, c_stride), writeable=False)
+
+def to_stacks(windows, flow_mean, dtype=np.float32):
+    """
+    method to turn windows of sliding_windows into mean-subtracted network input
+    of shape (n, h, w, 2*length). This is the only copy of the window data
+    """
+    n, h, w, length, _ = windows.shape
+    stacks = np.empty(windows.shape, dtype=dtype)
+    np.subtract(windows, flow_mean.reshape(h, w, length, 2), out=stacks, dtype=dtype)
+    return stacks.reshape(n, h, w, 2 * length)
+
+def stack_batches(flow, length, flow_mean, batch_size, dtype=np.float32):
+    """
+    Generator over the mean-subtracted stacks of every sliding window of a
+    video, batch_size windows at a time, so that only one batch is ever
+    expanded to float.
+    Input:
+    * flow: (frames, h, w, 2) uint8 flow of the video
+    * length: sliding window length L
+    * flow_mean: (h, w, 2*length) mean stack
+    * batch_size: windows per batch
+    * dtype: dtype of the stacks
+    Output: (index of the first window, (n, h, w, 2*length) stacks) pairs
+    """
+    windows = sliding_windows(flow, length)
+    for start in range(0, len(windows), batch_size):
+        yield start, to_stacks(windows[start:start+batch_size], flow_mean, dtype)
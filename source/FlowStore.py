@@ -0,0 +1,127 @@
+import os
+import json
+import numpy as np
+
+from .FlowStacks import sliding_windows
+
+class ArrayStore:
+    """
+    packed video dataset: every video is a single uint8 .npy array of shape
+    (frames, height, width, channels), read back memory-mapped. index.json keeps,
+    in order, the name, label (if any) and number of frames of every video, so
+    the video boundaries are known without opening them
+    """
+    INDEX_FILE = "index.json"
+
+    def __init__(self, root):
+        self.root = root
+        self.videos = []
+        self._arrays = {}
+        index_path = os.path.join(root, self.INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                self.videos = json.load(f)["videos"]
+        self._positions = {video["name"]: i for i, video in enumerate(self.videos)}
+
+    def __len__(self):
+        return len(self.videos)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    @property
+    def names(self):
+        return [video["name"] for video in self.videos]
+
+    @property
+    def labels(self):
+        return np.array([video["label"] for video in self.videos], dtype=np.int64)
+
+    @property
+    def frames(self):
+        return np.array([video["frames"] for video in self.videos], dtype=np.int64)
+
+    def offsets(self, length=1):
+        """
+        method to get the first global window index of every video, plus the total,
+        for sliding windows of the given length (length=1 gives the frame boundaries)
+        """
+        nb_windows = np.maximum(self.frames - length + 1, 0)
+        return np.concatenate([[0], np.cumsum(nb_windows)]).astype(np.int64)
+
+    def position(self, video):
+        """
+        method to get the index position of a video given by name or position
+        """
+        return self._positions[video] if isinstance(video, str) else int(video)
+
+    def path(self, name):
+        return os.path.join(self.root, name + ".npy")
+
+    def create(self, name, nb_frames, height=224, width=224, channels=2):
+        """
+        method to allocate the array of a new video on disk and return it as a
+        writable memmap, the video is only listed once add() registers it
+        """
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(nb_frames, height, width, channels))
+
+    def add(self, name, label, nb_frames):
+        """
+        method to register a video written with create(), replacing any previous entry,
+        label is None for a video without one (e.g. a resized source video)
+        """
+        self._arrays.pop(name, None)
+        video = {"name": name, "frames": int(nb_frames)}
+        if label is not None:
+            video["label"] = int(label)
+        if name in self._positions:
+            self.videos[self._positions[name]] = video
+        else:
+            self._positions[name] = len(self.videos)
+            self.videos.append(video)
+
+    def put(self, name, label, video):
+        """
+        method to store a whole (frames, height, width, channels) uint8 array as a video
+        """
+        array = self.create(name, *video.shape)
+        array[...] = video
+        array.flush()
+        del array
+        self.add(name, label, len(video))
+
+    def save_index(self):
+        """
+        method to write the index, through a temporary file so a reader never sees a partial one
+        """
+        os.makedirs(self.root, exist_ok=True)
+        index_path = os.path.join(self.root, self.INDEX_FILE)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump({"videos": self.videos}, f)
+        os.replace(index_path + ".tmp", index_path)
+
+    def array(self, video):
+        """
+        method to get the read-only memmap of a video, by name or position
+        """
+        name = self.videos[self.position(video)]["name"]
+        if name not in self._arrays:
+            self._arrays[name] = np.load(self.path(name), mmap_mode="r")
+        return self._arrays[name]
+
+class FlowStore(ArrayStore):
+    """
+    packed optical flow dataset: the quantized flow of every video is stored as a
+    (frames, height, width, 2) array, x then y
+    """
+    def flow(self, video):
+        return self.array(video)
+
+    def windows(self, video, length):
+        """
+        method to get every sliding window of a video as a zero-copy view of its
+        memmap, see FlowStacks.sliding_windows for the layout
+        """
+        return sliding_windows(self.flow(video), length)
@@ -0,0 +1,92 @@
+import os
+import json
+import random
+import numpy as np
+import multiprocessing as mp
+
+# thread pools of the numerical libraries, capped per fold worker
+THREAD_VARIABLES = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"]
+
+def _capped_environment(threads):
+    """
+    method to set the thread caps in the parent environment, returns the previous
+    values. Spawned workers re-import the parent __main__, and TensorFlow with it,
+    before any initializer runs, so the caps only work if they inherit them
+    """
+    previous = {variable: os.environ.get(variable) for variable in THREAD_VARIABLES}
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(threads)
+    return previous
+
+def _restore_environment(previous):
+    for variable, value in previous.items():
+        if value is None:
+            os.environ.pop(variable, None)
+        else:
+            os.environ[variable] = value
+
+def _run_fold(fold_fn, fold_number, seed, threads, args):
+    import tensorflow as tf
+    # folds share the GPU, none of them may take all of its memory up front
+    for gpu in tf.config.list_physical_devices("GPU"):
+        tf.config.experimental.set_memory_growth(gpu, True)
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(min(threads, 2))
+
+    random.seed(seed)
+    np.random.seed(seed)
+    tf.random.set_seed(seed)
+    return fold_fn(fold_number, *args)
+
+def run_folds(fold_fn, folds, max_workers, threads_per_fold, seed):
+    """
+    Runs every cross-validation fold in its own spawned worker process, so each
+    fold starts from a fresh classifier, optimizer and TensorFlow state.
+    Input:
+    * fold_fn: module level function called as fold_fn(fold_number, *args)
+    * folds: list with the argument tuple of every fold, fold numbers start at 1
+    * max_workers: maximum number of folds running at the same time
+    * threads_per_fold: thread cap of each fold's numerical libraries
+    * seed: base seed, fold n is seeded with seed + n
+    Output: list of the fold_fn results, in fold order
+    """
+    max_workers = max(1, min(max_workers, len(folds)))
+    ctx = mp.get_context("spawn")
+    # kept for the whole pool, workers replaced after each fold are spawned with it too
+    previous = _capped_environment(threads_per_fold)
+    try:
+        # one task per worker, a fold never inherits the state of a previous one
+        with ctx.Pool(processes=max_workers, maxtasksperchild=1) as pool:
+            pending = [pool.apply_async(_run_fold, (fold_fn, fold_number, seed + fold_number, threads_per_fold, args))
+                for fold_number, args in enumerate(folds, start=1)]
+            return [result.get() for result in pending]
+    finally:
+        _restore_environment(previous)
+
+def summarize_folds(fold_metrics):
+    """
+    method to merge the binary_metrics of every fold into a results.json entry:
+    mean and standard deviation, in percent, of each reported metric
+    """
+    summary = {}
+    for name, key in [("sensitivity", "recall"), ("specificity", "specificity"),
+            ("far", "fpr"), ("mdr", "fnr"), ("accuracy", "accuracy")]:
+        values = [metrics[key] for metrics in fold_metrics]
+        summary[name + "_mean"] = float(np.mean(values)*100.)
+        summary[name + "_std_dev"] = float(np.std(values)*100.)
+    return summary
+
+def update_results(results_file, key, summary):
+    """
+    method to store a summary under key in the results json file, keeping the other entries
+    """
+    results = {}
+    if os.path.exists(results_file):
+        with open(results_file, "r") as f:
+            results = json.load(f) or {}
+
+    results[key] = summary
+    with open(results_file, "w") as f:
+        json.dump(results, f, indent=4)
+    return results
@@ -0,0 +1,136 @@
+import time
+import queue
+import numpy as np
+from multiprocessing import Process, Queue, Semaphore
+from multiprocessing.shared_memory import SharedMemory
+
+from .FlowStacks import stack_shape
+
+# each slot starts with (response request_id, decision) followed by the flow stack
+HEADER_BYTES = 16
+
+def slot_bytes(shape):
+    return HEADER_BYTES + int(np.prod(shape)) * np.dtype(np.float32).itemsize
+
+def slot_views(shm, shape):
+    header = np.ndarray((2,), dtype=np.int64, buffer=shm.buf)
+    stack = np.ndarray(shape, dtype=np.float32, buffer=shm.buf, offset=HEADER_BYTES)
+    return header, stack
+
+class InferenceClient:
+    """
+    handle a camera process uses to run its flow stacks through the shared
+    inference server. Each camera owns one shared memory slot and has at most
+    one request in flight, so the slot is never overwritten while queued.
+    The server answers in the slot header and releases the slot's semaphore
+    """
+    def __init__(self, slot, shm, shape, requests, ready, timeout=None):
+        self.slot = slot
+        self.shm = shm
+        self.shape = shape
+        self.requests = requests
+        self.ready = ready
+        self.timeout = timeout
+        # ids keep increasing across worker restarts on the same slot
+        self.request_id = time.time_ns()
+
+    def infer(self, stack):
+        """
+        method to classify a single (h, w, 2*L) float32 flow stack, returns True on a fall.
+        Raises TimeoutError when the server has not answered within timeout seconds
+        """
+        header, slot_stack = slot_views(self.shm, self.shape)
+        slot_stack[...] = stack
+        self.request_id += 1
+        self.requests.put((self.slot, self.request_id))
+
+        # skip answers meant for an earlier request on this slot, e.g. of a worker that died
+        # or of a request that timed out
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.time(), 0)
+            if not self.ready.acquire(timeout=remaining):
+                raise TimeoutError(f"Inference server did not answer request {self.request_id} within {self.timeout}s.")
+            if header[0] == self.request_id:
+                return bool(header[1])
+
+class InferenceServer(Process):
+    """
+    single process owning the VGG16 trunk and classifier for all cameras.
+    Requests are batched dynamically: the server blocks for the first one and
+    then keeps collecting until max_batch_size is reached or max_batch_wait
+    seconds have passed
+    """
+    def __init__(self, config, num_cameras):
+        super().__init__()
+        self.config = config
+        self.max_batch_size = self.config["max_batch_size"]
+        self.max_batch_wait = self.config["max_batch_wait"]
+        self.requests = Queue()
+        self.shape = stack_shape(self.config)
+        self.slots = [SharedMemory(create=True, size=slot_bytes(self.shape)) for _ in range(num_cameras)]
+        self.ready = [Semaphore(0) for _ in range(num_cameras)]
+        self.stopping = False
+
+    def client(self, slot):
+        return InferenceClient(slot, self.slots[slot], self.shape, self.requests, self.ready[slot],
+            self.config["inference_timeout"])
+
+    def run(self):
+        # the network, and TensorFlow with it, is only loaded inside the server process
+        from .Model import create_model
+        model = create_model(self.config)
+        views = [slot_views(shm, self.shape) for shm in self.slots]
+
+        while not self.stopping:
+            batch = self.next_batch()
+            if not batch:
+                continue
+
+            inputs = np.stack([views[slot][1] for slot, _ in batch])
+            _, results = model.infer(inputs)
+
+            # hand the per-camera results back
+            for (slot, request_id), result in zip(batch, results):
+                header = views[slot][0]
+                header[1] = result
+                header[0] = request_id
+                self.ready[slot].release()
+
+    def next_batch(self):
+        """
+        method to collect the next batch of (slot, request_id) requests
+        """
+        batch = []
+        request = self.requests.get()
+        deadline = time.time() + self.max_batch_wait
+
+        while True:
+            if request is None:
+                self.stopping = True
+                break
+            batch.append(request)
+            if len(batch) >= self.max_batch_size:
+                break
+
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+        return batch
+
+    def stop(self):
+        self.requests.put(None)
+
+    def release_transport(self):
+        """
+        method to release the shared memory slots once the server and cameras have exited,
+        Process.close() still has to be called for the process itself
+        """
+        for shm in self.slots:
+            shm.close()
+            shm.unlink()
@@ -1,21 +1,53 @@
 import time
+from queue import Empty
 from multiprocessing import Process
+from .Sinks import create_sinks
 
 class Monitor(Process):
-    def __init__(self, queue):
+    def __init__(self, queue, config):
         super().__init__()
         self.queue = queue
+        self.config = config
+        self.cooldown = self.config["alert_cooldown"]
+        self.last_alert = {}
 
     def run(self):
+        # sinks are created in the monitoring process, they may hold files or sockets
+        self.sinks = create_sinks(self.config)
+
         while True:
-            if not self.queue.empty():
-                new_elem = self.queue.get()
-                idx, result = new_elem
+            # block until a message arrives, then drain everything that is available
+            messages = [self.queue.get()]
+            while True:
+                try:
+                    messages.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            for new_elem in messages:
+                # None is the shutdown message
+                if new_elem is None:
+                    for sink in self.sinks:
+                        sink.close()
+                    return
+                self.handle(*new_elem)
 
-                # fall detected in camera {idx}
-                if (result):
-                    print(f"Possible fall detected in camera {idx}. Please check.")
-                else:
-                    print(f"Camera {idx} health status message. No falls detected.")
+    def handle(self, idx, result, stats=None):
+        # fall detected in camera {idx}
+        if (result):
+            # repeated fall alerts of the same camera within the cooldown are dropped
+            now = time.time()
+            if now - self.last_alert.get(idx, -self.cooldown) < self.cooldown:
+                return
+            self.last_alert[idx] = now
+            message = f"Possible fall detected in camera {idx}. Please check."
+        else:
+            message = f"Camera {idx} health status message. No falls detected."
+            if stats is not None:
+                message += " {}/{} windows skipped on static scenes.".format(
+                    stats["windows_skipped"], stats["windows_total"])
+                message += " Detection FPS: {:.1f}, {} stale windows dropped.".format(
+                    stats["detection_fps"], stats["windows_dropped"])
 
-            time.sleep(1)
\ No newline at end of file
+        for sink in self.sinks:
+            sink.emit(idx, result, message)
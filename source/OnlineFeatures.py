@@ -0,0 +1,252 @@
+import queue
+import threading
+import numpy as np
+from collections import deque
+import scipy.io as sio
+import tensorflow as tf
+from concurrent.futures import ThreadPoolExecutor
+
+from .Augmentation import compile_chain, sample_chain
+from .FlowStacks import sliding_windows
+from .FlowStore import ArrayStore, FlowStore
+from .Model import load_vgg16_trunk
+from .OpticalFlow import create_flow_engine
+
+class OnlineFeatures:
+    """
+    Feature set computed from the frames instead of read from an h5 file, so
+    that training can augment the frames on the fly. Row i is the sliding
+    window stack i over the segments of a frame store (one BGR video per
+    segment, see dataset_preprocessing/pack_frames_URFD.py): L+1 frames give L
+    flow pairs, stacked and run through the VGG16 trunk.
+    The unaugmented flow never changes, it is computed once into a flow
+    store (fill_flow_cache) and its windows are read from there; only the
+    augmented windows go through augmentation and optical flow. It has the
+    labels/read/blocks/read_block interface of FeatureLoader.H5Features.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.length = config["sliding_window_length"]
+        self.batch_size = config["online_batch_size"]
+        self.policy = config["augmentation_policy"]
+        self.probability = config["augmentation_probability"]
+        self.num_features = config["num_features"]
+
+        self.frames = ArrayStore(config["frame_store_path"])
+        self.flow_cache = FlowStore(config["flow_cache_path"])
+        self.flow_mean = sio.loadmat(config["mean_file"])['image_mean'].astype(np.float32)
+
+        # window i -> (segment, first frame)
+        self.offsets = self.frames.offsets(self.length + 1)
+        self.segments = np.repeat(np.arange(len(self.frames)), np.diff(self.offsets))
+        self.starts = np.arange(int(self.offsets[-1])) - self.offsets[self.segments]
+        self.labels = self.frames.labels[self.segments].astype(np.float32)[:, np.newaxis]
+
+        # optical flow and augmentation release the GIL, threads are enough
+        self.executor = ThreadPoolExecutor(config["augmentation_workers"])
+        self._local = threading.local()
+        self._trunk = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def engine(self):
+        # flow engines keep state between calls, one per thread
+        if not hasattr(self._local, "engine"):
+            self._local.engine = create_flow_engine(self.config)
+        return self._local.engine
+
+    def compute_flow(self, frames):
+        """
+        method to compute the quantized flow between the consecutive frames of a
+        (n, h, w, 3) batch, returns a (n-1, h, w, 2) uint8 array
+        """
+        flow = np.empty((len(frames) - 1,) + frames.shape[1:3] + (2,), dtype=np.uint8)
+        for i in range(len(flow)):
+            flow[i, ..., 0], flow[i, ..., 1] = self.engine.compute(frames[i], frames[i+1])
+        return flow
+
+    def fill_flow_cache(self):
+        """
+        method to compute the unaugmented flow of the segments missing from the flow
+        store, must run before worker processes read the store
+        """
+        missing = iter([name for name in self.frames.names if name not in self.flow_cache])
+        pending = deque()
+
+        def submit():
+            name = next(missing, None)
+            if name is not None:
+                pending.append((name, self.executor.submit(self.compute_flow, self.frames.array(name))))
+
+        # at most two segments per worker are computed ahead of the writes
+        for _ in range(2 * self.config["augmentation_workers"]):
+            submit()
+        while pending:
+            name, future = pending.popleft()
+            flow = future.result()
+            submit()
+            self.flow_cache.put(name, self.frames.videos[self.frames.position(name)]["label"], flow)
+            self.flow_cache.save_index()
+            print("flow cached for {}: {} frames".format(name, len(flow)))
+
+    def window(self, index, chain=None):
+        """
+        method to get the (h, w, 2*L) uint8 flow stack of a window, augmented by
+        chain when given, read from the flow cache otherwise (computed from the
+        frames if the segment is not cached)
+        """
+        segment, start = self.segments[index], self.starts[index]
+        name = self.frames.videos[segment]["name"]
+        if not chain and name in self.flow_cache:
+            windows = sliding_windows(self.flow_cache.flow(name), self.length)
+            flow = windows[start]
+        else:
+            frames = self.frames.array(segment)[start:start+self.length+1]
+            if chain:
+                frames = compile_chain(chain)(frames)
+            flow = sliding_windows(self.compute_flow(frames), self.length)[0]
+        return flow.reshape(flow.shape[:2] + (2 * self.length,))
+
+    def windows(self, indices, chains=None):
+        """
+        method to get the uint8 flow stacks of the given windows, computed in the thread pool
+        """
+        chains = chains or [None] * len(indices)
+        return np.stack(list(self.executor.map(self.window, indices, chains)))
+
+    @property
+    def trunk(self):
+        if self._trunk is None:
+            self._trunk = load_vgg16_trunk(self.config)
+        return self._trunk
+
+    def extract(self, stacks):
+        """
+        method to turn uint8 flow stacks into trunk features, called eagerly so that
+        the trunk runs on the GPU when there is one
+        """
+        return self.trunk(tf.cast(stacks, tf.float32) - self.flow_mean, training=False)
+
+    def blocks(self, indices):
+        """
+        method to split row indices into sorted blocks of online_batch_size rows
+        """
+        indices = np.sort(np.asarray(indices, dtype=np.int64))
+        return [indices[start:start+self.batch_size] for start in range(0, len(indices), self.batch_size)]
+
+    def read_block(self, rows):
+        """
+        method to compute the unaugmented features and labels of a block returned by blocks()
+        """
+        return np.asarray(self.extract(self.windows(rows)), dtype=np.float32), self.labels[rows]
+
+    def read(self, indices):
+        """
+        method to compute the unaugmented features of the given rows, in sorted order
+        """
+        parts = [self.read_block(block) for block in self.blocks(indices)]
+        if not parts:
+            return np.zeros((0, self.num_features), dtype=np.float32), self.labels[:0]
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def augmented_batches(self, indices, seed=None):
+        """
+        Generator over (uint8 flow stacks, labels) of the given rows in a random
+        order, online_batch_size windows at a time. Each window is augmented,
+        with augmentation_probability, by its own chain drawn from the policy,
+        the same chain for all its frames so the flow stays consistent
+        """
+        rng = np.random.RandomState(seed)
+        indices = np.asarray(indices, dtype=np.int64)[rng.permutation(len(indices))]
+        for start in range(0, len(indices), self.batch_size):
+            rows = indices[start:start+self.batch_size]
+            chains = [sample_chain(self.policy, rng) if rng.rand() < self.probability else None for _ in rows]
+            yield self.windows(rows, chains), self.labels[rows]
+
+def feature_batches(data, stacks, batch_size):
+    """
+    Generator over (features, labels) batches of batch_size rows from a dataset
+    of uint8 flow stack batches. The trunk is called eagerly in a thread of its
+    own, outside tf.data whose functions are placed on the CPU, one batch ahead
+    of the consumer.
+    Input:
+    * data: OnlineFeatures set the stacks come from
+    * stacks: tf.data.Dataset of (uint8 flow stacks, labels) batches
+    * batch_size: rows per yielded batch
+    """
+    batches = queue.Queue(maxsize=1)
+    stop = threading.Event()
+
+    def put(item):
+        # gives up when the consumer is gone
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            features, labels = np.zeros((0, data.num_features), dtype=np.float32), data.labels[:0]
+            for X, y in stacks:
+                features = np.concatenate([features, np.asarray(data.extract(X), dtype=np.float32)])
+                labels = np.concatenate([labels, y.numpy()])
+                while len(labels) >= batch_size:
+                    if not put((features[:batch_size], labels[:batch_size])):
+                        return
+                    features, labels = features[batch_size:], labels[batch_size:]
+            if len(labels) and not put((features, labels)):
+                return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield batch
+    finally:
+        stop.set()
+
+def make_online_dataset(selections, batch_size, seed=None):
+    """
+    Keras fit input over the selected windows of an OnlineFeatures set: a new
+    augmentation of every window on each epoch, in batches of batch_size rows.
+    Only the uint8 flow stacks are produced by tf.data, the trunk features are
+    computed eagerly by feature_batches.
+    Input:
+    * selections: list of (OnlineFeatures, row indices) pairs, on a single set
+    * batch_size: rows per classifier batch
+    * seed: seed of the order and augmentations
+    """
+    data = selections[0][0]
+    if any(other is not data for other, _ in selections):
+        raise ValueError("Online augmentation supports a single feature set per dataset.")
+    indices = np.concatenate([rows for _, rows in selections])
+    rng = np.random.RandomState(seed)
+    length = data.length
+
+    def stack_generator():
+        return data.augmented_batches(indices, rng.randint(2**31 - 1))
+
+    stacks = tf.data.Dataset.from_generator(stack_generator, output_types=(tf.uint8, tf.float32),
+        output_shapes=(tf.TensorShape([None, None, None, 2 * length]), tf.TensorShape([None, 1]))).prefetch(2)
+
+    def generator():
+        return feature_batches(data, stacks, batch_size)
+
+    # restarted on every epoch, the trunk is built before the first one
+    data.trunk
+    dataset = tf.data.Dataset.from_generator(generator, output_types=(tf.float32, tf.float32),
+        output_shapes=(tf.TensorShape([None, data.num_features]), tf.TensorShape([None, 1])))
+    return dataset.prefetch(1)
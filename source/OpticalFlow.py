@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+
+class FlowEngine:
+    """
+    base class for in-process optical flow engines. Subclasses implement
+    compute_flow, which returns the raw float32 (h, w, 2) flow field between
+    two grayscale frames; quantization follows dense_flow's extract_cpu so
+    the output matches the flow images the model was trained on
+    """
+    def __init__(self, bound=20):
+        self.bound = bound
+
+    def compute_flow(self, prev_gray, curr_gray):
+        raise NotImplementedError
+
+    def compute(self, prev_frame, curr_frame):
+        """
+        method to compute the quantized x/y flow images between two consecutive frames
+        """
+        flow = self.compute_flow(to_gray(prev_frame), to_gray(curr_frame))
+        return quantize_flow(flow, self.bound)
+
+class FarnebackFlow(FlowEngine):
+    def compute_flow(self, prev_gray, curr_gray):
+        return cv2.calcOpticalFlowFarneback(prev_gray, curr_gray, None,
+            pyr_scale=0.5, levels=3, winsize=15, iterations=3, poly_n=5, poly_sigma=1.2, flags=0)
+
+class DISFlow(FlowEngine):
+    def __init__(self, bound=20):
+        super().__init__(bound)
+        self.dis = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_MEDIUM)
+
+    def compute_flow(self, prev_gray, curr_gray):
+        return self.dis.calc(prev_gray, curr_gray, None)
+
+class TVL1Flow(FlowEngine):
+    def __init__(self, bound=20):
+        super().__init__(bound)
+        # TV-L1 lives in the contrib modules (opencv-contrib-python)
+        if hasattr(cv2, "optflow"):
+            self.tvl1 = cv2.optflow.DualTVL1OpticalFlow_create()
+        elif hasattr(cv2, "DualTVL1OpticalFlow_create"):
+            self.tvl1 = cv2.DualTVL1OpticalFlow_create()
+        else:
+            raise RuntimeError("TV-L1 optical flow requires opencv-contrib-python.")
+
+    def compute_flow(self, prev_gray, curr_gray):
+        return self.tvl1.calc(prev_gray, curr_gray, None)
+
+FLOW_ENGINES = {
+    "farneback": FarnebackFlow,
+    "dis": DISFlow,
+    "tvl1": TVL1Flow,
+}
+
+def create_flow_engine(config):
+    """
+    method to build the flow engine selected by config["flow_engine"]
+    """
+    name = config["flow_engine"]
+    if name not in FLOW_ENGINES:
+        raise ValueError(f"Unknown flow engine {name}, expected one of {sorted(FLOW_ENGINES)}.")
+    return FLOW_ENGINES[name](bound=config["flow_bound"])
+
+def to_gray(frame):
+    if frame.ndim == 3:
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return frame
+
+def quantize_flow(flow, bound):
+    """
+    maps flow values in [-bound, bound] linearly onto [0, 255] and clips the
+    rest, same as extract_cpu -b=bound
+    """
+    scaled = (flow + bound) * (255.0 / (2 * bound))
+    quantized = np.clip(np.rint(scaled), 0, 255).astype(np.uint8)
+    return quantized[..., 0], quantized[..., 1]
+
+def motion_energy(flow_x, flow_y, bound, min_magnitude):
+    """
+    fraction of pixels of a quantized flow pair that move by more than
+    min_magnitude pixels, a cheap measure of how much is happening in the scene
+    """
+    threshold = min_magnitude * 255.0 / (2 * bound)
+    dx = flow_x.astype(np.float32) - 127.5
+    dy = flow_y.astype(np.float32) - 127.5
+    return np.count_nonzero(dx * dx + dy * dy > threshold * threshold) / dx.size
@@ -0,0 +1,165 @@
+import os
+import glob
+import json
+import time
+import numpy as np
+import scipy.io as sio
+import tensorflow as tf
+
+from .FlowStacks import flow_image_files, read_flow_images, sliding_windows, to_stacks
+
+class QuantizedModel:
+    """
+    runtime for a quantized TFLite export of the fused VGG16 trunk + classifier,
+    exposing the same infer() contract as Model
+    """
+    def __init__(self, config):
+        self.config = config
+        self.threshold = self.config["threshold"]
+        self.interpreter = tf.lite.Interpreter(model_path=self.config["quantized_model_path"],
+            num_threads=self.config["tflite_threads"])
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = 1
+
+    def infer(self, flow_stack):
+        """
+        method to run a (h, w, 2*L) float32 flow stack, or a batch of them, through the
+        quantized model. Returns the classifier output and the decision, True on a fall
+        """
+        single = flow_stack.ndim == 3
+        if single:
+            flow_stack = flow_stack[np.newaxis, ...]
+
+        # the interpreter is resized whenever the batch size changes
+        if flow_stack.shape[0] != self.batch_size:
+            self.batch_size = flow_stack.shape[0]
+            self.interpreter.resize_tensor_input(self.input_details['index'], flow_stack.shape)
+            self.interpreter.allocate_tensors()
+            self.input_details = self.interpreter.get_input_details()[0]
+            self.output_details = self.interpreter.get_output_details()[0]
+
+        inputs = flow_stack.astype(np.float32)
+        if self.input_details['dtype'] != np.float32:
+            scale, zero_point = self.input_details['quantization']
+            inputs = np.round(inputs / scale + zero_point).astype(self.input_details['dtype'])
+
+        self.interpreter.set_tensor(self.input_details['index'], inputs)
+        self.interpreter.invoke()
+        outputs = self.interpreter.get_tensor(self.output_details['index'])
+
+        if self.output_details['dtype'] != np.float32:
+            scale, zero_point = self.output_details['quantization']
+            outputs = (outputs.astype(np.float32) - zero_point) * scale
+
+        probabilities = outputs[:, 0]
+        decisions = probabilities < self.threshold
+
+        if single:
+            return float(probabilities[0]), bool(decisions[0])
+        return probabilities, decisions
+
+def load_flow_stacks(flow_folder, mean_file, length, nb_stacks, seed=7):
+    """
+    Samples nb_stacks sliding window stacks from the flow_x*/flow_y* images found
+    (recursively) under flow_folder, mean-subtracted the same way as in training.
+    Input:
+    * flow_folder: root of the optical flow dataset
+    * mean_file: path to flow_mean.mat
+    * length: sliding window length L
+    * nb_stacks: number of stacks to sample
+    * seed: seed of the random sampling
+    """
+    flow_mean = sio.loadmat(mean_file)['image_mean'].astype(np.float32)
+
+    # every folder holding at least one full window is a candidate
+    folders = sorted(set(os.path.dirname(f) for f in
+        glob.glob(os.path.join(flow_folder, '**', 'flow_x*.jpg'), recursive=True)))
+    nb_windows = np.array([max(len(flow_image_files(folder)[0]) - length + 1, 0) for folder in folders],
+        dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(nb_windows)])
+
+    rng = np.random.RandomState(seed)
+    chosen = rng.choice(int(offsets[-1]), min(nb_stacks, int(offsets[-1])), replace=False)
+
+    # each folder with a chosen window is decoded once, its windows are views of it
+    stacks = np.zeros((len(chosen),) + flow_mean.shape[:2] + (2 * length,), dtype=np.float32)
+    folder_ids = np.searchsorted(offsets, chosen, side='right') - 1
+    for k in np.unique(folder_ids):
+        windows = sliding_windows(read_flow_images(folders[k]), length)
+        rows = np.flatnonzero(folder_ids == k)
+        stacks[rows] = to_stacks(windows[chosen[rows] - offsets[k]], flow_mean)
+    return stacks
+
+def export_tflite(model, output_path, mode, calibration_stacks=None):
+    """
+    Converts the fused trunk + classifier of a float Model into a post-training
+    quantized TFLite file.
+    Input:
+    * model: float Model instance
+    * output_path: path of the .tflite file to write
+    * mode: 'int8' (weights and activations, needs calibration_stacks) or 'float16'
+    * calibration_stacks: float32 flow stacks used to calibrate activation ranges
+    """
+    fused = tf.keras.Model(inputs=model.model.input, outputs=model.classifier(model.model.output))
+    converter = tf.lite.TFLiteConverter.from_keras_model(fused)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if mode == 'int8':
+        def representative_dataset():
+            for stack in calibration_stacks:
+                yield [stack[np.newaxis, ...]]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif mode == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        raise ValueError(f"Unknown quantization mode {mode}, expected 'int8' or 'float16'.")
+
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+
+def parity_report(model, quantized_model, stacks, output_path=None):
+    """
+    Compares the quantized model against the float model on the given stacks:
+    classifier output differences, decision agreement and per-stack latency.
+    The report is printed and, if output_path is given, stored as json.
+    """
+    if len(stacks) < 1:
+        raise ValueError("The parity report needs at least 1 stack, got none.")
+    float_probabilities, float_decisions = np.zeros(len(stacks)), np.zeros(len(stacks), dtype=bool)
+    quant_probabilities, quant_decisions = np.zeros(len(stacks)), np.zeros(len(stacks), dtype=bool)
+    float_time, quant_time = 0.0, 0.0
+
+    # warm up both models so tracing and tensor allocation are not timed
+    model.infer(stacks[0])
+    quantized_model.infer(stacks[0])
+
+    for i, stack in enumerate(stacks):
+        start = time.time()
+        float_probabilities[i], float_decisions[i] = model.infer(stack)
+        float_time += time.time() - start
+
+        start = time.time()
+        quant_probabilities[i], quant_decisions[i] = quantized_model.infer(stack)
+        quant_time += time.time() - start
+
+    difference = np.abs(float_probabilities - quant_probabilities)
+    report = {
+        "nb_stacks": len(stacks),
+        "max_abs_difference": float(difference.max()),
+        "mean_abs_difference": float(difference.mean()),
+        "decision_agreement": float(np.mean(float_decisions == quant_decisions)),
+        "float_latency_ms": 1000. * float_time / len(stacks),
+        "quantized_latency_ms": 1000. * quant_time / len(stacks),
+    }
+
+    print('PARITY REPORT ===================')
+    for key, value in report.items():
+        print('{}: {}'.format(key, value))
+
+    if output_path is not None:
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=4)
+    return report
@@ -0,0 +1,118 @@
+import os
+import cv2
+from multiprocessing import Pool
+
+from .FlowStore import ArrayStore
+
+INTERPOLATIONS = {
+    "nearest": cv2.INTER_NEAREST,
+    "linear": cv2.INTER_LINEAR,
+    "area": cv2.INTER_AREA,
+    "cubic": cv2.INTER_CUBIC,
+}
+
+class FrameResizer:
+    """
+    resizes frames to (w, h) with a named interpolation, the one resize used by
+    the offline cache and the live cameras so both see the same pixels
+    """
+    def __init__(self, w, h, interpolation="linear"):
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f"Unknown interpolation {interpolation}, expected one of {sorted(INTERPOLATIONS)}.")
+        self.w = w
+        self.h = h
+        self.interpolation = interpolation
+
+    def __call__(self, frame, out=None):
+        """
+        method to resize a frame, written into out when given (a (h, w, c) uint8 buffer)
+        """
+        return cv2.resize(frame, (self.w, self.h), dst=out, interpolation=INTERPOLATIONS[self.interpolation])
+
+def _resize_video(job):
+    """
+    method run by the pool: reads every frame of a video once and writes it at each
+    of the missing sizes into the memmaps of the cache, returns (name, number of frames)
+    """
+    name, images, targets = job
+    outputs = []
+    for root, w, h, interpolation in targets:
+        outputs.append((FrameResizer(w, h, interpolation), ArrayStore(root).create(name, len(images), h, w, 3)))
+    for i, image in enumerate(images):
+        x = cv2.imread(image)
+        for resize, frames in outputs:
+            resize(x, frames[i])
+    for _, frames in outputs:
+        frames.flush()
+    return name, len(images)
+
+def _init_worker():
+    # one core per worker, the parallelism comes from the pool
+    cv2.setNumThreads(1)
+
+class ResizeService:
+    """
+    Cache of resized videos on disk, keyed by (source, W, H, interpolation): one
+    ArrayStore of unlabelled (frames, H, W, 3) BGR videos per size and interpolation under
+    root, a video being named by its source (e.g. Falls/fall-01-cam0-rgb).
+    Missing entries are computed by a process pool that decodes every source
+    frame once for all the requested sizes, so adding a resolution only costs
+    the resize of that resolution.
+    """
+    def __init__(self, root, workers=None):
+        self.root = root
+        self.workers = workers or os.cpu_count()
+        self._stores = {}
+
+    def store(self, w, h, interpolation="linear"):
+        """
+        method to get the ArrayStore holding the videos resized to (w, h) with interpolation
+        """
+        key = (w, h, interpolation)
+        if key not in self._stores:
+            self._stores[key] = ArrayStore(os.path.join(self.root, "{}x{}_{}".format(w, h, interpolation)))
+        return self._stores[key]
+
+    def missing(self, name, images, sizes, interpolation="linear"):
+        """
+        method to get the sizes a video is not cached at, a cached video with another
+        number of frames counts as missing
+        """
+        missing = []
+        for w, h in sizes:
+            store = self.store(w, h, interpolation)
+            if name not in store or store.frames[store.position(name)] != len(images):
+                missing.append((w, h))
+        return missing
+
+    def resize(self, videos, sizes, interpolation="linear"):
+        """
+        Fills the cache for the given videos and sizes, only what is missing is computed.
+        Input:
+        * videos: list of (name, sorted frame paths) pairs
+        * sizes: list of (W, H)
+        * interpolation: key of INTERPOLATIONS
+        """
+        jobs = []
+        for name, images in videos:
+            targets = [(self.store(w, h, interpolation).root, w, h, interpolation)
+                for w, h in self.missing(name, images, sizes, interpolation)]
+            if targets:
+                jobs.append((name, images, targets))
+        if not jobs:
+            return
+
+        with Pool(self.workers, initializer=_init_worker) as pool:
+            for done, ((name, nb_frames), (_, _, targets)) in enumerate(zip(pool.imap(_resize_video, jobs), jobs), start=1):
+                for _, w, h, _ in targets:
+                    store = self.store(w, h, interpolation)
+                    store.add(name, None, nb_frames)
+                    store.save_index()
+                print("[{}/{}] {} resized to {}".format(done, len(jobs), name,
+                    ", ".join("{}x{}".format(w, h) for _, w, h, _ in targets)))
+
+    def frames(self, name, w, h, interpolation="linear"):
+        """
+        method to get the read-only (frames, h, w, 3) memmap of a cached video
+        """
+        return self.store(w, h, interpolation).array(name)
@@ -0,0 +1,47 @@
+import time
+from collections import deque
+
+class DetectionScheduler:
+    """
+    decides when a camera's detection thread runs: only once `stride` new flow
+    frames have been committed since the last detection. Frames that arrive
+    while a detection is running are folded into the next window instead of
+    being queued, the windows that never got a detection of their own are
+    counted as dropped
+    """
+    def __init__(self, flow_buffer, stride, fps_window=50):
+        self.flow_buffer = flow_buffer
+        self.stride = stride
+        self.last_count = 0
+        self.detections = 0
+        self.dropped = 0
+        self.timestamps = deque(maxlen=fps_window)
+
+    def next_window(self, timeout=None):
+        """
+        method to block until the next detection is due, returns the flow frames
+        committed since the last detection (oldest first) or None on timeout
+        """
+        # the first detection waits for a full window
+        target = max(self.last_count + self.stride, self.flow_buffer.length)
+        if not self.flow_buffer.wait_for(target, timeout):
+            return None
+
+        frames, count = self.flow_buffer.snapshot(since=self.last_count)
+        if self.detections > 0:
+            self.dropped += (count - self.last_count) // self.stride - 1
+        self.last_count = count
+        self.detections += 1
+        self.timestamps.append(time.time())
+        return frames
+
+    def fps(self):
+        """
+        method to compute the achieved detection rate over the last detections
+        """
+        if len(self.timestamps) < 2:
+            return 0.0
+        return (len(self.timestamps) - 1) / (self.timestamps[-1] - self.timestamps[0])
+
+    def stats(self):
+        return {"detection_fps": self.fps(), "windows_dropped": self.dropped}
@@ -0,0 +1,154 @@
+import os
+import csv
+import numpy as np
+
+# one row per segment: frames [start, end) of a video, 0-based, all with the same label
+SEGMENT_DTYPE = np.dtype([("video", "U16"), ("start", np.int32), ("end", np.int32), ("label", np.int8)])
+
+def read_frame_labels(labels_file):
+    """
+    method to read the frame level labels of a URFD csv file, returns
+    {video id: array with 0 for a fall frame and 1 otherwise, in csv order}.
+    In the csv a fall frame is marked 0, -1 and 1 being the other states
+    """
+    labels = dict()
+    with open(labels_file, 'rt') as csvfile:
+        for row in csv.reader(csvfile, delimiter=' ', quotechar='|'):
+            elems = row[0].split(',')
+            labels.setdefault(elems[0], []).append(0 if int(elems[2]) == 0 else 1)
+    return {video: np.array(values, dtype=np.int8) for video, values in labels.items()}
+
+class SegmentIndex:
+    """
+    table of the URFD segments, (video, start, end, label) rows built once from
+    the csv labels: every run of equally labelled frames of a fall video, and
+    every ADL video as a whole (see from_csv). Loaders slice the original frames of a segment
+    with frames(), nothing is copied
+    """
+    def __init__(self, segments):
+        self.segments = np.asarray(segments, dtype=SEGMENT_DTYPE)
+        self._listings = {}
+
+    @classmethod
+    def from_csv(cls, falls_labels, adls_labels=None, data_folder=None):
+        """
+        Builds the index from the label files. Fall videos are split with the
+        falls csv, frames past its rows are left out as before. An ADL video is
+        a single segment over all its frames: when data_folder is given its
+        frames are counted in its folder, so frames past the csv rows are kept
+        and ADL videos missing from the csv (or all of them without an ADL
+        csv) are indexed too; otherwise the csv rows are used.
+        Input:
+        * falls_labels: falls csv
+        * adls_labels: ADL csv, optional with data_folder
+        * data_folder: folder holding the original 'Falls' and 'ADLs' videos
+        Output: SegmentIndex
+        """
+        rows = []
+        for video, labels in read_frame_labels(falls_labels).items():
+            # a segment ends wherever the label changes
+            bounds = np.concatenate([[0], np.flatnonzero(np.diff(labels)) + 1, [len(labels)]])
+            rows += [(video, start, end, labels[start]) for start, end in zip(bounds[:-1], bounds[1:])]
+
+        adls = {}
+        if adls_labels is not None:
+            adls = {video: len(labels) for video, labels in read_frame_labels(adls_labels).items()}
+        index = cls(np.zeros(0, dtype=SEGMENT_DTYPE))
+        if data_folder is not None and os.path.isdir(os.path.join(data_folder, 'ADLs')):
+            suffix = '-cam0-rgb'
+            adls.update({event[:-len(suffix)]: None for event in os.listdir(os.path.join(data_folder, 'ADLs'))
+                if event.endswith(suffix) and event[:-len(suffix)] not in adls})
+        for video in sorted(adls):
+            end = adls[video]
+            if data_folder is not None and os.path.isdir(index.video_folder(data_folder, video)):
+                end = len(index.video_frames(data_folder, video))
+            rows.append((video, 0, end, 1))
+        return cls(np.array(rows, dtype=SEGMENT_DTYPE))
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path))
+
+    def save(self, path):
+        np.save(path, self.segments)
+
+    def __len__(self):
+        return len(self.segments)
+
+    @property
+    def labels(self):
+        return self.segments["label"].astype(np.int64)
+
+    @property
+    def lengths(self):
+        return (self.segments["end"] - self.segments["start"]).astype(np.int64)
+
+    @property
+    def names(self):
+        """
+        names of the segments, those of the folders the old preprocessing wrote:
+        Falls/<video>-cam0-rgb for a fall, NotFalls/<video>-cam0-rgb_pre and _post
+        for what comes before and after it, NotFalls/<video>-cam0-rgb for an ADL
+        """
+        names, seen, fallen = [], {}, set()
+        for video, _, _, label in self.segments:
+            event = '{}-cam0-rgb'.format(video)
+            if label == 0:
+                name = 'Falls/' + event
+                fallen.add(video)
+            elif video.startswith('fall'):
+                name = 'NotFalls/{}_{}'.format(event, 'post' if video in fallen else 'pre')
+            else:
+                name = 'NotFalls/' + event
+            # a second run of the same kind, not found in URFD, gets a number
+            seen[name] = seen.get(name, 0) + 1
+            names.append(name if seen[name] == 1 else '{}_{}'.format(name, seen[name]))
+        return names
+
+    def video_name(self, video):
+        """
+        method to get the folder of a video relative to the data folder, e.g. Falls/fall-01-cam0-rgb
+        """
+        return os.path.join('Falls' if video.startswith('fall') else 'ADLs', '{}-cam0-rgb'.format(video))
+
+    def video_folder(self, data_folder, video):
+        return os.path.join(data_folder, self.video_name(video))
+
+    def video_frames(self, data_folder, video):
+        """
+        method to get the sorted frame paths of a whole video, each folder is listed only once
+        """
+        folder = self.video_folder(data_folder, video)
+        if folder not in self._listings:
+            self._listings[folder] = sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                if os.path.isfile(os.path.join(folder, f)))
+        return self._listings[folder]
+
+    def videos(self, data_folder):
+        """
+        method to list the indexed videos found under data_folder as (name, sorted frame
+        paths), name being the folder relative to data_folder, in index order
+        """
+        videos = dict.fromkeys(self.segments["video"])
+        return [(self.video_name(video), self.video_frames(data_folder, video)) for video in videos
+            if os.path.isdir(self.video_folder(data_folder, video))]
+
+    def frames(self, i, data_folder):
+        """
+        method to get the sorted frame paths of segment i under data_folder
+        """
+        video, start, end, _ = self.segments[i]
+        return self.video_frames(data_folder, video)[start:end]
+
+def load_segment_index(path, falls_labels, adls_labels=None, data_folder=None):
+    """
+    method to load the segment index saved at path, building it from the label
+    files and data folder (see SegmentIndex.from_csv) and saving it there first
+    if it does not exist
+    """
+    if os.path.exists(path):
+        return SegmentIndex.load(path)
+    index = SegmentIndex.from_csv(falls_labels, adls_labels, data_folder)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    index.save(path)
+    return index
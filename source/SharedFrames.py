@@ -0,0 +1,109 @@
+import time
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+
+# int64 header words
+COUNT = 0
+HEADER_WORDS = 1
+
+class SharedFrameRing:
+    """
+    zero-copy transport of a camera's frames and flow pairs between processes,
+    laid out in one shared memory block: an int64 header holding the committed
+    frame count, one sequence number per slot, then fixed-size slots for (h, w, 3) frames and (h, w, 2) flow pairs.
+
+    There is a single producer and no locks. A slot's sequence number is -1
+    while it is being written, and readers keep a copy only if every slot they
+    copied still holds the frame number they expected. The reading side has the
+    same interface as FlowRingBuffer, so a DetectionScheduler can run on either.
+    Pickling the ring (e.g. passing it to a Process) attaches to the same block
+    """
+    def __init__(self, length, h=224, w=224, name=None, create=True, poll_interval=0.002):
+        self.length = length
+        self.h = h
+        self.w = w
+        self.create = create
+        self.poll_interval = poll_interval
+
+        sizes = [HEADER_WORDS * 8, length * 8, length * h * w * 3, length * h * w * 2]
+        self.shm = SharedMemory(name=name, create=create, size=sum(sizes))
+        offsets = np.cumsum([0] + sizes)
+        self.header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=self.shm.buf, offset=offsets[0])
+        self.slot_seq = np.ndarray((length,), dtype=np.int64, buffer=self.shm.buf, offset=offsets[1])
+        self.frames = np.ndarray((length, h, w, 3), dtype=np.uint8, buffer=self.shm.buf, offset=offsets[2])
+        self.flows = np.ndarray((length, h, w, 2), dtype=np.uint8, buffer=self.shm.buf, offset=offsets[3])
+
+        if create:
+            self.header[:] = 0
+            self.slot_seq[:] = -1
+
+    @classmethod
+    def attach(cls, name, length, h=224, w=224):
+        return cls(length, h, w, name=name, create=False)
+
+    def __reduce__(self):
+        return (SharedFrameRing.attach, (self.name, self.length, self.h, self.w))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def count(self):
+        return int(self.header[COUNT])
+
+    def write(self, flow_x, flow_y, frame=None):
+        """
+        method to commit a new flow pair, and optionally the frame it ends on,
+        overwriting the oldest slot
+        """
+        count = self.count
+        slot = count % self.length
+        self.slot_seq[slot] = -1
+        if frame is not None:
+            self.frames[slot] = frame
+        self.flows[slot, ..., 0] = flow_x
+        self.flows[slot, ..., 1] = flow_y
+        self.slot_seq[slot] = count
+        self.header[COUNT] = count + 1
+
+    def snapshot(self, since=0, with_frames=False):
+        """
+        method to copy out the flow pairs (and frames) committed after frame number
+        `since`, at most one window, oldest first, together with the committed count
+        """
+        while True:
+            count = self.count
+            nb_frames = min(count - since, self.length)
+            numbers = np.arange(count - nb_frames, count)
+            order = numbers % self.length
+            flows = self.flows[order]
+            frames = self.frames[order] if with_frames else None
+
+            # keep the copy only if none of its slots was rewritten meanwhile
+            if np.array_equal(self.slot_seq[order], numbers):
+                if with_frames:
+                    return flows, frames, count
+                return flows, count
+
+    def wait_for(self, count, timeout=None):
+        """
+        method to poll until at least `count` frames have been committed,
+        returns False if the timeout expired first
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self.count < count:
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+        return True
+
+    def close(self):
+        # the numpy views must be released before the block can be closed
+        self.header = self.slot_seq = self.frames = self.flows = None
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        if self.create:
+            self.shm.unlink()
@@ -0,0 +1,58 @@
+import json
+import time
+import urllib.request
+
+class StdoutSink:
+    def emit(self, idx, result, message):
+        print(message)
+
+    def close(self):
+        pass
+
+class LogFileSink:
+    def __init__(self, path):
+        self.file = open(path, "a")
+
+    def emit(self, idx, result, message):
+        self.file.write("{} {}\n".format(time.strftime("%Y-%m-%d %H:%M:%S"), message))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class WebhookSink:
+    """
+    posts every alert as json to a local http endpoint, failures are reported
+    but never stop the monitor
+    """
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+
+    def emit(self, idx, result, message):
+        body = json.dumps({"camera": idx, "fall": result, "message": message, "time": time.time()})
+        request = urllib.request.Request(self.url, data=body.encode("utf-8"),
+            headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+        except OSError as e:
+            print(f"Webhook {self.url} failed: {e}")
+
+    def close(self):
+        pass
+
+def create_sinks(config):
+    """
+    method to build the alert sinks listed in config["alert_sinks"]
+    """
+    sinks = []
+    for name in config["alert_sinks"]:
+        if name == "stdout":
+            sinks.append(StdoutSink())
+        elif name == "log_file":
+            sinks.append(LogFileSink(config["alert_log_file"]))
+        elif name == "webhook":
+            sinks.append(WebhookSink(config["alert_webhook_url"], config["alert_webhook_timeout"]))
+        else:
+            raise ValueError(f"Unknown alert sink {name}.")
+    return sinks
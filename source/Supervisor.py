@@ -0,0 +1,124 @@
+import time
+import signal
+import threading
+from multiprocessing import Queue, Event
+from .Camera import Camera
+from .Monitor import Monitor
+from .InferenceServer import InferenceServer
+
+class CameraSupervisor:
+    """
+    runs one capture worker per entry of config["camera_sources"] (device
+    indices, video files or stream urls), all sharing a single inference
+    server and monitor. Dead workers are restarted, with a growing delay for
+    those exiting right after they start (e.g. a finished video file or a
+    camera that fails to open) until the source is given up, and everything
+    is shut down cleanly on SIGTERM or SIGINT, or when the inference server
+    or the monitor exits
+    """
+    def __init__(self, config):
+        self.config = config
+        self.sources = self.config["camera_sources"]
+        self.queue = Queue()
+        self.stop_event = Event()
+        self.stopping = threading.Event()
+
+        self.server = InferenceServer(self.config, len(self.sources))
+        self.monitor = Monitor(self.queue, self.config)
+        self.cameras = [None] * len(self.sources)
+        # per slot: start time of the worker, consecutive quick exits and next restart (None once given up)
+        self.started = [0.0] * len(self.sources)
+        self.failures = [0] * len(self.sources)
+        self.restart_at = [None] * len(self.sources)
+
+    def start_camera(self, slot):
+        camera = Camera(self.sources[slot], self.queue, self.config,
+            self.server.client(slot), self.stop_event)
+        camera.start()
+        self.cameras[slot] = camera
+        self.started[slot] = time.time()
+        self.restart_at[slot] = None
+
+    def reap_camera(self, slot):
+        """
+        method to release the exited worker of a slot and schedule its restart, the
+        delay doubling with every exit within camera_min_uptime of its start
+        """
+        camera = self.cameras[slot]
+        camera.join()
+        exitcode = camera.exitcode
+        camera.release_transport()
+        camera.close()
+        self.cameras[slot] = None
+
+        if time.time() - self.started[slot] < self.config["camera_min_uptime"]:
+            self.failures[slot] += 1
+        else:
+            self.failures[slot] = 0
+        if self.failures[slot] > self.config["camera_max_restarts"]:
+            print(f"Camera {self.sources[slot]} worker exited {self.failures[slot]} times in a row right after starting, giving up on it.")
+            return
+
+        delay = 0
+        if self.failures[slot]:
+            delay = min(self.config["supervisor_interval"] * 2 ** (self.failures[slot] - 1), self.config["camera_max_backoff"])
+        self.restart_at[slot] = time.time() + delay
+        print(f"Camera {self.sources[slot]} worker exited with code {exitcode}, restarting in {delay}s.")
+
+    def run(self):
+        # the server and monitor ignore Ctrl+C, they are stopped by shutdown()
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self.server.start()
+        self.monitor.start()
+
+        # installed after the server and monitor are forked, cameras reset SIGTERM themselves
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+
+        for slot in range(len(self.sources)):
+            self.start_camera(slot)
+
+        # the wait returns as soon as a signal sets the event
+        while not self.stopping.wait(self.config["supervisor_interval"]):
+            for slot, camera in enumerate(self.cameras):
+                if camera is not None and not camera.is_alive():
+                    self.reap_camera(slot)
+                if self.cameras[slot] is None and self.restart_at[slot] is not None and time.time() >= self.restart_at[slot]:
+                    self.start_camera(slot)
+            if all(camera is None for camera in self.cameras) and all(t is None for t in self.restart_at):
+                print("No camera left to supervise.")
+                break
+            # the server and monitor are shared by every camera, losing either ends the run
+            if not self.server.is_alive() or not self.monitor.is_alive():
+                name = "Inference server" if not self.server.is_alive() else "Monitor"
+                print(f"{name} exited, shutting down.")
+                break
+
+        self.shutdown()
+
+    def handle_signal(self, signum, frame):
+        self.stopping.set()
+
+    def shutdown(self):
+        """
+        method to stop the cameras, then the inference server and the monitor
+        """
+        print("Shutting down fall detection monitoring.")
+        self.stop_event.set()
+        for camera in self.cameras:
+            if camera is None:
+                continue
+            camera.join(self.config["shutdown_timeout"])
+            if camera.is_alive():
+                camera.terminate()
+                camera.join()
+            camera.release_transport()
+            camera.close()
+
+        self.server.stop()
+        self.server.join()
+        self.server.release_transport()
+        self.server.close()
+
+        self.queue.put(None)
+        self.monitor.join()
@@ -0,0 +1,495 @@
+import os
+import h5py
+import shutil
+import numpy as np
+from matplotlib import pyplot as plt
+
+from tensorflow.keras.models import load_model, Model as KerasModel
+from tensorflow.keras.layers import Input, Activation, Dense, Dropout
+from tensorflow.keras.optimizers import Adam
+from tensorflow.keras.layers import BatchNormalization, ELU
+from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
+from sklearn.model_selection import KFold, StratifiedShuffleSplit
+
+from .Model import Model
+from .Evaluation import binary_metrics, print_metrics
+from .FeatureLoader import H5Features, stream_batches, make_dataset
+from .OnlineFeatures import OnlineFeatures, make_online_dataset
+from .FoldRunner import run_folds, summarize_folds, update_results
+
+class TrainingModel(Model):
+    """
+    Model extended with the training, cross-validation and plotting code. It
+    lives apart from Model so the inference path never imports matplotlib,
+    sklearn or the Keras training utilities
+    """
+    def load_classifier(self):
+        """
+        method to build and compile the classifier for training, then load the checkpoint
+        """
+        # initialize classifier
+        adam = Adam(lr=self.config["learning_rate"], beta_1=0.9, beta_2=0.999, epsilon=1e-08, decay=0.0005)
+        self.model.compile(optimizer=adam, loss='categorical_crossentropy', metrics=['accuracy'])
+        self.classifier = build_classifier(self.config)
+
+        # load model from checkpoints
+        print("loading checkpoints...")
+        self.classifier = load_model(self.config["model_checkpoints_path"])
+        print("Checkpoints loaded.")
+
+    def sample_from_dataset(self, X, y, zeroes, ones):
+        """
+        Samples from X and y using the indices obtained from the arrays
+        all0 and all1 taking slices that depend on the fold, the slice_size
+        the mode.
+        Input:
+        * X: array of features
+        * y: array of labels
+        * all0: indices of sampled labelled as class 0 in y
+        * all1: indices of sampled labelled as class 1 in y
+        * fold: integer, fold number (from the cross-validation)
+        * slice_size: integer, half of the size of a fold
+        * mode: 'train' or 'test', used to choose how to slice
+        
+        if mode == 'train':
+            s, t = 0, fold*slice_size
+            s2, t2 = (fold+1)*slice_size, None
+            temp = np.concatenate((
+                np.hstack((all0[s:t], all0[s2:t2])),
+                np.hstack((all1[s:t], all1[s2:t2]))
+            ))
+        elif mode == 'test':
+            s, t = fold*slice_size, (fold+1)*slice_size
+            temp = np.concatenate((all0[s:t], all1[s:t])) 
+        """
+
+        indices = np.concatenate([zeroes, ones], axis=0)
+        sampled_X = X[indices]
+        sampled_y = y[indices]
+        return sampled_X, sampled_y
+
+    @staticmethod
+    def divide_train_val(zeroes, ones, val_size):
+        rand0 = np.random.permutation(len(zeroes))
+        train_indices_0 = zeroes[rand0[val_size//2:]]
+        val_indices_0 = zeroes[rand0[:val_size//2]]
+        rand1 = np.random.permutation(len(ones))
+        train_indices_1 = ones[rand1[val_size//2:]]
+        val_indices_1 = ones[rand1[:val_size//2]]
+        return (train_indices_0, train_indices_1, val_indices_0, val_indices_1)
+
+    @staticmethod
+    def plot_training_info(case, metrics, save, history):
+        """
+        Function to create plots for train and validation loss and accuracy
+        Input:
+        * case: name for the plot, an 'accuracy.png' or 'loss.png' 
+        will be concatenated after the name.
+        * metrics: list of metrics to store: 'loss' and/or 'accuracy'
+        * save: boolean to store the plots or only show them.
+        * history: History object returned by the Keras fit function.
+        """
+        val = False
+        if 'val_acc' in history and 'val_loss' in history:
+            val = True
+        
+        plt.ioff()
+        if 'accuracy' in metrics:     
+            fig = plt.figure()
+            plt.plot(history['acc'])
+            if val: plt.plot(history['val_acc'])
+            plt.title('model accuracy')
+            plt.ylabel('accuracy')
+            plt.xlabel('epoch')
+            if val: 
+                plt.legend(['train', 'val'], loc='upper left')
+            else:
+                plt.legend(['train'], loc='upper left')
+            if save == True:
+                plt.savefig(case + 'accuracy.png')
+                plt.gcf().clear()
+            else:
+                plt.show()
+            plt.close(fig)
+
+        # summarize history for loss
+        if 'loss' in metrics:
+            fig = plt.figure()
+            plt.plot(history['loss'])
+            if val: plt.plot(history['val_loss'])
+            plt.title('model loss')
+            plt.ylabel('loss')
+            plt.xlabel('epoch')
+            #plt.ylim(1e-3, 1e-2)
+            plt.yscale("log")
+            if val: 
+                plt.legend(['train', 'val'], loc='upper left')
+            else:
+                plt.legend(['train'], loc='upper left')
+            if save == True:
+                plt.savefig(case + 'loss.png')
+                plt.gcf().clear()
+            else:
+                plt.show()
+            plt.close(fig)
+
+    def train_model_combined(self):
+        """
+        method to train fall detection model with all datasets. The balanced
+        folds are built here from the labels only, then every fold is trained
+        in its own process, streaming its features from the h5 files
+        """
+        np.random.seed(self.config["cv_seed"])
+
+        # Only the labels of each dataset are loaded
+        feature_sets = open_feature_sets(self.config, ['multicam', 'urfd', 'fdd'])
+        y_multicam = feature_sets['multicam'].labels
+        y_urfd = feature_sets['urfd'].labels
+        y_fdd = feature_sets['fdd'].labels
+
+        # Get the number of samples per class on the smallest dataset: URFD
+        size_0 = np.asarray(np.where(y_urfd==0)[0]).shape[0]
+        size_1 = np.asarray(np.where(y_urfd==1)[0]).shape[0]
+
+        # Undersample the FDD and Multicam: take 0s and 1s per dataset and
+        # undersample each of them separately by random sampling without replacement
+        # Step 1
+        all0_multicam = np.asarray(np.where(y_multicam==0)[0])
+        all1_multicam = np.asarray(np.where(y_multicam==1)[0])
+        all0_urfd = np.asarray(np.where(y_urfd==0)[0])
+        all1_urfd = np.asarray(np.where(y_urfd==1)[0])
+        all0_fdd = np.asarray(np.where(y_fdd==0)[0])
+        all1_fdd = np.asarray(np.where(y_fdd==1)[0])
+
+        # Step 2
+        all0_multicam = np.random.choice(all0_multicam, size_0, replace=False)
+        all1_multicam = np.random.choice(all1_multicam, size_0, replace=False)
+        all0_urfd = np.random.choice(all0_urfd, size_0, replace=False)
+        all1_urfd = np.random.choice(all1_urfd, size_0, replace=False)
+        all0_fdd = np.random.choice(all0_fdd, size_0, replace=False)
+        all1_fdd = np.random.choice(all1_fdd, size_0, replace=False)
+
+        # Use a 5 fold cross-validation
+        kfold = KFold(n_splits=5, shuffle=True)
+        kfold0_multicam = kfold.split(all0_multicam)
+        kfold1_multicam = kfold.split(all1_multicam)
+        kfold0_urfd = kfold.split(all0_urfd)
+        kfold1_urfd = kfold.split(all1_urfd)
+        kfold0_fdd = kfold.split(all0_fdd)
+        kfold1_fdd = kfold.split(all1_fdd)
+
+        # CROSS-VALIDATION: Stratified partition of the dataset into train/test sets
+        folds = []
+        for fold in range(5):
+            # Get the train and test indices, then get the actual indices
+            _train0_multicam, _test0_multicam = next(kfold0_multicam)
+            _train1_multicam, _test1_multicam = next(kfold1_multicam)
+            train0_multicam = all0_multicam[_train0_multicam]
+            train1_multicam = all1_multicam[_train1_multicam]
+            test0_multicam = all0_multicam[_test0_multicam]
+            test1_multicam = all1_multicam[_test1_multicam]
+
+            _train0_urfd, _test0_urfd = next(kfold0_urfd)
+            _train1_urfd, _test1_urfd = next(kfold1_urfd)
+            train0_urfd = all0_urfd[_train0_urfd]
+            train1_urfd = all1_urfd[_train1_urfd]
+            test0_urfd = all0_urfd[_test0_urfd]
+            test1_urfd = all1_urfd[_test1_urfd]
+
+            _train0_fdd, _test0_fdd = next(kfold0_fdd)
+            _train1_fdd, _test1_fdd = next(kfold1_fdd)
+            train0_fdd = all0_fdd[_train0_fdd]
+            train1_fdd = all1_fdd[_train1_fdd]
+            test0_fdd = all0_fdd[_test0_fdd]
+            test1_fdd = all1_fdd[_test1_fdd]
+
+            val = None
+            if self.config["use_validation"]:
+                # Multicam
+                (train0_multicam, train1_multicam,
+                val0_multicam, val1_multicam) = self.divide_train_val(
+                    train0_multicam, train1_multicam, self.config["validation_size"]//3)
+
+                # URFD
+                (train0_urfd, train1_urfd,
+                val0_urfd, val1_urfd) = self.divide_train_val(
+                    train0_urfd, train1_urfd, self.config["validation_size"]//3)
+
+                # FDD
+                (train0_fdd, train1_fdd,
+                val0_fdd, val1_fdd) = self.divide_train_val(
+                    train0_fdd, train1_fdd, self.config["validation_size"]//3)
+
+                val = [('multicam', np.concatenate((val0_multicam, val1_multicam))),
+                    ('urfd', np.concatenate((val0_urfd, val1_urfd))),
+                    ('fdd', np.concatenate((val0_fdd, val1_fdd)))]
+
+            # Row selections of the train and evaluation folds of each dataset
+            train = [('multicam', np.concatenate((train0_multicam, train1_multicam))),
+                ('urfd', np.concatenate((train0_urfd, train1_urfd))),
+                ('fdd', np.concatenate((train0_fdd, train1_fdd)))]
+            test_multicam = [('multicam', np.concatenate((test0_multicam, test1_multicam)))]
+            test_urfd = [('urfd', np.concatenate((test0_urfd, test1_urfd)))]
+            test_fdd = [('fdd', np.concatenate((test0_fdd, test1_fdd)))]
+            tests = [('combined', 'combined test set', test_multicam + test_urfd + test_fdd),
+                ('urfd', 'URFD test set', test_urfd),
+                ('multicam', 'Multicam test set', test_multicam),
+                ('fdd', 'FDD test set', test_fdd)]
+            folds.append((self.config, self.exp, train, val, tests))
+
+        fold_results = run_folds(train_fold, folds, self.config["cv_workers"],
+            self.config["cv_threads_per_fold"], self.config["cv_seed"])
+        # the last fold's model is served, as when the folds overwrote a single checkpoint
+        publish_checkpoint(self.config, len(folds))
+
+        # End of the Cross-Validation
+        print('CROSS-VALIDATION RESULTS ===================')
+        for key, name in [('combined', 'Combined'), ('urfd', 'URFD'), ('multicam', 'Multicam'), ('fdd', 'FDD')]:
+            summary = summarize_folds([results[key] for results in fold_results])
+            print("Sensitivity {}: {:.2f}% (+/- {:.2f}%)".format(
+                name, summary["sensitivity_mean"], summary["sensitivity_std_dev"]))
+            print("Specificity {}: {:.2f}% (+/- {:.2f}%)\n".format(
+                name, summary["specificity_mean"], summary["specificity_std_dev"]))
+
+    def train_ufrd(self):
+        """
+        method to train fall detection model with UFRD dataset. The folds are
+        built here from the labels only, then every fold is trained in its own
+        process and the merged metrics are added to results.json
+        """
+        np.random.seed(self.config["cv_seed"])
+
+        if self.config["online_augmentation"]:
+            # the windows of the frame store are the samples, their unaugmented
+            # flow is cached once here, before the fold processes read it
+            online_features = OnlineFeatures(self.config)
+            online_features.fill_flow_cache()
+            _y_full = online_features.labels
+        else:
+            h5labels = h5py.File(self.config["labels_file_urfd"], 'r')
+            _y_full = np.asarray(h5labels["labels"])
+            h5labels.close()
+
+        zeroes_full = np.asarray(np.where(_y_full==0)[0])
+        ones_full = np.asarray(np.where(_y_full==1)[0])
+        zeroes_full.sort()
+        ones_full.sort()
+        
+        # Use a 5 fold cross-validation
+        kf_falls = KFold(n_splits=5, shuffle=True)
+        kf_nofalls = KFold(n_splits=5, shuffle=True)
+
+        # CROSS-VALIDATION: Stratified partition of the dataset into train/test sets
+        folds = []
+        for ((train_index_falls, test_index_falls), (train_index_nofalls, test_index_nofalls)) in zip(
+            kf_falls.split(zeroes_full), kf_nofalls.split(ones_full)):
+            # rows of the URFD feature set in each part of the fold
+            train_falls = zeroes_full[train_index_falls]
+            train_nofalls = ones_full[train_index_nofalls]
+            test_rows = np.concatenate((zeroes_full[test_index_falls], ones_full[test_index_nofalls]))
+
+            val = None
+            if self.config["use_validation"]:
+                # Create a validation subset from the training set
+                trainval_split_0 = StratifiedShuffleSplit(n_splits=1, test_size=self.config["validation_size"]//2, random_state=7)
+                train_indices_0, val_indices_0 = next(trainval_split_0.split(train_falls, np.zeros(len(train_falls))))
+                trainval_split_1 = StratifiedShuffleSplit(n_splits=1, test_size=self.config["validation_size"]//2, random_state=7)
+                train_indices_1, val_indices_1 = next(trainval_split_1.split(train_nofalls, np.zeros(len(train_nofalls))))
+
+                val = [('urfd', np.concatenate((train_falls[val_indices_0], train_nofalls[val_indices_1])))]
+                train_falls = train_falls[train_indices_0]
+                train_nofalls = train_nofalls[train_indices_1]
+        
+            # Balance the number of positive and negative samples so that
+            # there is the same amount of each of them
+            if len(train_falls) < len(train_nofalls):
+                train_nofalls = np.random.choice(train_nofalls, len(train_falls), replace=False)
+            else:
+                train_falls = np.random.choice(train_falls, len(train_nofalls), replace=False)
+
+            train = [('urfd', np.concatenate((train_falls, train_nofalls)))]
+            tests = [('urfd', 'results:', [('urfd', test_rows)])]
+            folds.append((self.config, self.exp, train, val, tests))
+
+        fold_results = run_folds(train_fold, folds, self.config["cv_workers"],
+            self.config["cv_threads_per_fold"], self.config["cv_seed"])
+        # the last fold's model is served, as when the folds overwrote a single checkpoint
+        publish_checkpoint(self.config, len(folds))
+
+        summary = summarize_folds([results['urfd'] for results in fold_results])
+        update_results(self.config["plots_folder"] + 'results.json', str(self.config["epochs"]), summary)
+
+        print('5-FOLD CROSS-VALIDATION RESULTS ===================')
+        print("Sensitivity: %.2f%% (+/- %.2f%%)" % (summary["sensitivity_mean"], summary["sensitivity_std_dev"]))
+        print("Specificity: %.2f%% (+/- %.2f%%)" % (summary["specificity_mean"], summary["specificity_std_dev"]))
+        print("FAR: %.2f%% (+/- %.2f%%)" % (summary["far_mean"], summary["far_std_dev"]))
+        print("MDR: %.2f%% (+/- %.2f%%)" % (summary["mdr_mean"], summary["mdr_std_dev"]))
+        print("Accuracy: %.2f%% (+/- %.2f%%)" % (summary["accuracy_mean"], summary["accuracy_std_dev"]))
+
+def build_classifier(config):
+    """
+    method to build and compile a freshly initialized classifier on top of the VGG16 features
+    """
+    adam = Adam(lr=config["learning_rate"], beta_1=0.9, beta_2=0.999, epsilon=1e-08, decay=0.0005)
+    extracted_features = Input(shape=(config["num_features"],),
+                dtype='float32', name='input')
+    
+    if config["batch_norm"]:
+        x = BatchNormalization(axis=-1, momentum=0.99, epsilon=0.001)(extracted_features)
+        x = Activation('relu')(x)
+    else:
+        x = ELU(alpha=1.0)(extracted_features)
+    
+    x = Dropout(0.9)(x)
+    x = Dense(4096, name='fc2', kernel_initializer='glorot_uniform')(x)
+    
+    if config["batch_norm"]:
+        x = BatchNormalization(axis=-1, momentum=0.99, epsilon=0.001)(x)
+        x = Activation('relu')(x)
+    else:
+        x = ELU(alpha=1.0)(x)
+
+    x = Dropout(0.8)(x)
+    x = Dense(1, name='predictions', kernel_initializer='glorot_uniform')(x)
+    x = Activation('sigmoid')(x)
+
+    classifier = KerasModel(inputs=extracted_features, outputs=x, name='classifier')
+    classifier.compile(optimizer=adam, loss='binary_crossentropy', metrics=['accuracy'])
+    return classifier
+
+def open_feature_sets(config, names):
+    """
+    method to open the h5 features and labels of the given datasets ('urfd',
+    'multicam' and/or 'fdd') as H5Features, by name, or URFD as OnlineFeatures
+    with online_augmentation
+    """
+    feature_sets = {}
+    for name in names:
+        if name == 'urfd' and config["online_augmentation"]:
+            # URFD features computed from its frames, augmented while training
+            feature_sets[name] = OnlineFeatures(config)
+            continue
+
+        h5features = h5py.File(config["features_file_" + name], 'r')
+        h5labels = h5py.File(config["labels_file_" + name], 'r')
+
+        if name == 'multicam':
+            # Multicam is stored per stage, camera and video, seen here as a single dataset
+            pairs = []
+            for i in range(1,25):
+                stage = 'chute{:02}'.format(i)
+                for cam in h5features[stage].keys():
+                    for key in h5features[stage][cam].keys():
+                        pairs.append((h5features[stage][cam][key], h5labels[stage][cam][key]))
+        else:
+            pairs = [(h5features['features'], h5labels['labels'])]
+        feature_sets[name] = H5Features(pairs, config["h5_block_rows"])
+    return feature_sets
+
+def fold_checkpoint_path(config, fold_number):
+    """
+    checkpoint of a single fold, folds running in parallel must not share one
+    """
+    root, extension = os.path.splitext(config["model_checkpoints_path"])
+    return '{}_fold{}{}'.format(root, fold_number, extension)
+
+def publish_checkpoint(config, fold_number):
+    """
+    method to copy the checkpoint of a fold to model_checkpoints_path, the one
+    the serving Model loads
+    """
+    shutil.copyfile(fold_checkpoint_path(config, fold_number), config["model_checkpoints_path"])
+
+def training_dataset(config, selections, batch_size):
+    """
+    method to build the Keras fit input of the training selections: streamed
+    stored features, or augmented windows for an OnlineFeatures set
+    """
+    seed = np.random.randint(2**31 - 1)
+    if any(isinstance(data, OnlineFeatures) for data, _ in selections):
+        return make_online_dataset(selections, batch_size, seed)
+    return make_dataset(selections, batch_size, shuffle=True, buffer_size=config["shuffle_buffer_size"], seed=seed)
+
+def predict_stream(classifier, selections, batch_size):
+    """
+    method to run a classifier over selections streamed from disk,
+    returns the classifier outputs and the matching labels
+    """
+    probabilities, labels = [], []
+    for X, y in stream_batches(selections, batch_size, shuffle=False):
+        probabilities.append(classifier.predict_on_batch(X))
+        labels.append(y)
+    return np.concatenate(probabilities), np.concatenate(labels)
+
+def train_fold(fold_number, config, experiment, train, val, tests):
+    """
+    Trains a fresh classifier on one cross-validation fold and evaluates it,
+    meant to run in its own process through run_folds.
+    Input:
+    * fold_number: number of the fold, starting at 1
+    * config: configuration dictionary
+    * experiment: name of the experiment, prefix of the plots
+    * train: list of (dataset name, rows) selections to train on
+    * val: list of (dataset name, rows) validation selections, or None
+    * tests: list of (key, title, selections) test sets to evaluate
+    Output: dict with the binary_metrics of every test set, by key
+    """
+    selections = train + (val or []) + [s for _, _, test in tests for s in test]
+    feature_sets = open_feature_sets(config, sorted(set(name for name, _ in selections)))
+    def resolve(selections):
+        return [(feature_sets[name], rows) for name, rows in selections]
+
+    checkpoint_path = fold_checkpoint_path(config, fold_number)
+    classifier = build_classifier(config)
+
+    # ==================== TRAINING ========================     
+    class_weight = {0:config["weight_0"], 1: 1}
+    callbacks = None
+    validation_data = None
+
+    if val is not None:
+        # callback definition
+        metric = 'val_loss'
+        e = EarlyStopping(monitor=metric, min_delta=0,patience=100, mode='auto')
+        c = ModelCheckpoint(checkpoint_path, monitor=metric, 
+            save_best_only=True, save_weights_only=False, mode='auto')
+        callbacks = [e, c]
+
+        # the validation set is small enough to be read into memory
+        val_parts = [data.read(rows) for data, rows in resolve(val)]
+        validation_data = (np.concatenate([X for X, _ in val_parts], axis=0),
+            np.concatenate([y for _, y in val_parts], axis=0))
+
+    _mini_batch_size = config["mini_batch_size"]
+    if config["mini_batch_size"] == 0:
+        _mini_batch_size = sum(len(rows) for _, rows in train)
+
+    train_data = training_dataset(config, resolve(train), _mini_batch_size)
+    history = classifier.fit(train_data, validation_data=validation_data,
+        epochs=config["epochs"], class_weight=class_weight, callbacks=callbacks)
+
+    if val is None:
+        classifier.save(checkpoint_path)
+
+    TrainingModel.plot_training_info(config["plots_folder"] + experiment + 'fold{}_'.format(fold_number),
+        ['accuracy', 'loss'], config["save_plots"], history.history)
+
+    if val is not None and config["use_validation_for_training"]:
+        classifier = load_model(checkpoint_path)
+
+        # Use full training set (training + validation)
+        train_data = training_dataset(config, resolve(train + val), _mini_batch_size)
+        history = classifier.fit(train_data, validation_data=validation_data,
+            epochs=config["epochs"], class_weight=class_weight, callbacks=callbacks)
+
+        classifier.save(checkpoint_path)
+
+    # ==================== EVALUATION ========================
+    classifier = load_model(checkpoint_path)
+
+    results = {}
+    for key, title, test in tests:
+        probabilities, labels = predict_stream(classifier, resolve(test), _mini_batch_size)
+        results[key] = binary_metrics(probabilities, labels, config["threshold"])
+        print_metrics(results[key], 'FOLD {} {}'.format(fold_number, title))
+    return results
@@ -0,0 +1,36 @@
+import os
+import sys
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# modules the camera runtime path must not pull in
+FORBIDDEN = ["tensorflow", "sklearn", "matplotlib"]
+
+def imported_packages(module):
+    """
+    method to import a module in a fresh interpreter with -X importtime,
+    returns {imported package: cumulative import time in seconds}
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+        cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True)
+    assert process.returncode == 0, "Importing {} failed:\n{}".format(module, process.stderr)
+
+    times = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, package = line.split("|")
+        times[package.strip()] = int(cumulative) / 1e6
+    return times
+
+def test_camera_import_skips_training_dependencies():
+    times = imported_packages("source.Camera")
+    forbidden = sorted(package for package in times if package.split(".")[0] in FORBIDDEN)
+    assert not forbidden, "Imported on the runtime path: {}".format(", ".join(forbidden))
+
+def test_supervisor_import_skips_training_dependencies():
+    times = imported_packages("source.Supervisor")
+    forbidden = sorted(package for package in times if package.split(".")[0] in FORBIDDEN)
+    assert not forbidden, "Imported on the runtime path: {}".format(", ".join(forbidden))